@@ -1,117 +1,458 @@
 """Intégration Home Assistant pour contrôler le bidet Wings/Jitian via Bluetooth."""
 import logging
-import binascii
 import asyncio
-from typing import Any
+import random
+import re
+import struct
+from collections.abc import Callable
+from functools import lru_cache, partial
 
 from bleak import BleakClient, BleakError
+from bleak.exc import BleakCharacteristicNotFoundError
+from bleak.backends.characteristic import BleakGATTCharacteristic
 from bleak_retry_connector import establish_connection, BleakNotFoundError
 
-from homeassistant.components import bluetooth
+from homeassistant.components import bluetooth, persistent_notification
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_ADDRESS, EVENT_HOMEASSISTANT_STOP
-from homeassistant.core import HomeAssistant, ServiceCall
-from homeassistant.exceptions import ConfigEntryNotReady
-from homeassistant.components.button import ButtonEntity
-from homeassistant.helpers.entity import Entity
+from homeassistant.core import HomeAssistant, ServiceCall, callback
 import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers import device_registry as dr
 import voluptuous as vol
 
 from .const import (
     DOMAIN, PLATFORMS, SERVICE_UUID, CHARACTERISTIC_UUID, 
     OLD_SERVICE_UUID, OLD_CHARACTERISTIC_UUID, 
-    SERVICE_PREPARE_PAIRING, SERVICE_TEST_COMMAND,
+    SERVICE_PREPARE_PAIRING, SERVICE_TEST_COMMAND, SERVICE_FLUSH_ALL, KEEPALIVE_INTERVAL,
+    RECONNECT_BACKOFF_BASE, RECONNECT_BACKOFF_MAX, RECONNECT_MAX_EXPONENT, WRITE_ATTEMPTS,
+    CONNECT_ATTEMPTS, CONNECT_TIMEOUT, WRITE_TIMEOUT, READ_TIMEOUT, RESPONSE_TIMEOUT, READ_CACHE_TTL,
     CMD_FLUSH, VAL_FLUSH_ON, VAL_FLUSH_OFF,
-    CMD_HEADER, CMD_PROTOCOL, CMD_TRAILER
+    CMD_HEADER, CMD_PROTOCOL, CMD_PROTOCOL_OLD, CMD_TRAILER
 )
 
 _LOGGER = logging.getLogger(__name__)
 
 
+class _LazyHex:
+    """Représentation hexadécimale calculée seulement si l'enregistrement de log est émis."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+
+    def __str__(self) -> str:
+        return self.data.hex()
+
+
+# Octets fixes des trames, décodés une seule fois à l'import
+_HEADER = bytes.fromhex(CMD_HEADER)
+_TRAILER = bytes.fromhex(CMD_TRAILER)
+_PROTOCOL_NEW = int(CMD_PROTOCOL, 16)
+_PROTOCOL_OLD = int(CMD_PROTOCOL_OLD, 16)
+
+# Début de trame: en-tête 55aa, protocole (2 octets), longueur (1 octet)
+_FRAME_HEAD = struct.Struct(">2sHB")
+
+
+def _calculate_checksum(buf: bytes) -> bytes:
+    """Calculer le checksum selon la méthode du bidet (somme des octets modulo 256)."""
+    return (sum(buf) & 0xFF).to_bytes(1, "big")
+
+
+def _build_frame(protocol: int, cmd: bytes, value: bytes) -> bytes:
+    """Construire une trame 55aa avec longueur dynamique et checksum (H0) comme l'app."""
+    # Données: <cmd> + 0001 + <value>
+    data = cmd + _TRAILER + value
+
+    # Longueur selon T0 (smali): len = (dp bytes) + 3
+    # Exemple flush: 1 (cmd) + 2 (0001) + 1 (val) = 4 -> 4 + 3 = 7 (0x07)
+    buf = bytearray(_FRAME_HEAD.pack(_HEADER, protocol, len(data) + 3))
+    buf += data
+    buf += _calculate_checksum(buf)
+    return bytes(buf)
+
+
+@lru_cache(maxsize=32)
+def _build_hex_frame(protocol: int, cmd_hex: str, value_hex: str) -> bytes:
+    """Construire une trame à partir de cmd/value en hexadécimal (décodés une fois par couple)."""
+    return _build_frame(protocol, bytes.fromhex(cmd_hex), bytes.fromhex(value_hex))
+
+
+# Trame statique calculée une seule fois à l'import (les trames de commande passent par _build_hex_frame)
+_PING_FRAME = _HEADER + b"\x00\x00\x00\x00" + _calculate_checksum(_HEADER + b"\x00\x00\x00\x00")
+
+# Variantes de pré-authentification observées dans l'app
+_AUTH_STANDARD = bytes.fromhex("d8b673097b01")
+_AUTH_PREFIX_ONLY = bytes.fromhex("d8b6737b01")
+_AUTH_PREFIX_INVERTED = bytes.fromhex("27498c7b01")
+_AUTH_NRF_DETECTED = bytes.fromhex("55aa0fa10000001203031e0204000000343a")
+_AUTH_SUFFIX = b"\x7b\x01"
+_AUTH_CHALLENGE_PREFIX = b"\xd8\xb6\x73"  # Début du challenge envoyé par le bidet
+
+# Trames fixes du service test_auth (la variante "challenge" est construite à partir de la valeur lue)
+_AUTH_VARIANTS = {
+    "standard": _AUTH_STANDARD,  # d8b673097b01
+    "prefix_only": _AUTH_PREFIX_ONLY,  # Préfixe + commande directe
+    "prefix_inverted": _AUTH_PREFIX_INVERTED,  # Préfixe inversé + commande
+    "nrf_detected": _AUTH_NRF_DETECTED,  # Format complet détecté dans nRF Connect
+}
+
+# Instructions d'appairage affichées par le service prepare_pairing
+_PAIRING_MESSAGE = (
+    "Pour préparer votre Top Toilet / Bidet WC à la détection Bluetooth :<br><br>"
+    "1. Redémarrez votre toilette (coupez l'alimentation et rallumez)<br>"
+    "2. Assurez-vous que votre toilette est à portée du serveur Home Assistant<br><br>"
+    "Une fois ces étapes effectuées, vous pouvez ajouter l'intégration via "
+    "Paramètres → Appareils et services → Ajouter une intégration → Top Toilet / Bidet WC"
+)
+_PAIRING_TITLE = "Préparer votre toilette pour l'intégration"
+_PAIRING_NOTIFICATION_ID = "bidet_pairing_instructions"
+
+# Validation des charges utiles hexadécimales (octets complets, sans espaces)
+_HEX_RE = re.compile(r"^(?:[0-9A-Fa-f]{2})+$")
+
+# Caractéristiques d'écriture à essayer (FFF1 nouveau, FFE1 ancien)
+_WRITE_UUIDS = (CHARACTERISTIC_UUID, OLD_CHARACTERISTIC_UUID)
+
+
+# Cache device_id -> entry_id pour les services de test (invalidé au déchargement de l'entrée)
+_DEVICE_ENTRY_CACHE: dict[str, str] = {}
+
+
+def _entry_id_for_device(hass: HomeAssistant, device_id: str) -> str | None:
+    """Retrouver l'entrée de configuration associée à un appareil (avec cache)."""
+    entry_id = _DEVICE_ENTRY_CACHE.get(device_id)
+    if entry_id is not None:
+        return entry_id
+
+    device = dr.async_get(hass).async_get(device_id)
+    if not device:
+        _LOGGER.error("Appareil non trouvé: %s", device_id)
+        return None
+
+    entry_id = next((identifier[1] for identifier in device.identifiers if identifier[0] == DOMAIN), None)
+    if entry_id is None:
+        _LOGGER.error("Impossible de trouver l'entrée de configuration pour l'appareil %s", device_id)
+        return None
+
+    _DEVICE_ENTRY_CACHE[device_id] = entry_id
+    return entry_id
+
+
 class BidetCoordinator:
     """Classe pour coordonner les communications avec le bidet."""
 
+    __slots__ = (
+        "hass", "address", "client", "connected",
+        "_disconnect_callbacks", "_connect_callbacks", "last_notification_data",
+        "write_char_uuid", "notify_char_uuid", "_working_uuid", "_services_dumped",
+        "_ack_write_uuids", "_chars", "_writable_uuids", "_services_stale", "_mtu",
+        "_lock", "_connect_lock", "_last_activity", "_reconnect_attempt", "_pending",
+        "_notify_subscribed", "_response_event", "_link_lost", "_preferred_format",
+        "_read_cache", "_closing", "_connect_task",
+    )
+
     def __init__(self, hass: HomeAssistant, address: str):
         """Initialiser le coordinateur."""
         self.hass = hass
         self.address = address
         self.client: BleakClient | None = None
         self.connected = False
-        self._disconnect_callbacks = []
-        self.last_notification_data = None  # Stockage de la dernière notification reçue
+        self._disconnect_callbacks: set[Callable[[], None]] = set()
+        self._connect_callbacks: set[Callable[[], None]] = set()
+        self.last_notification_data: bytes | None = None  # Dernière notification reçue (octets bruts)
         self.write_char_uuid = None
         self.notify_char_uuid = None
+        self._working_uuid: str | None = None  # Dernière caractéristique ayant accepté une écriture
+        self._services_dumped = False  # Liste des services déjà journalisée pour cette connexion
+        self._ack_write_uuids: set[str] = set()  # Caractéristiques sans write-without-response
+        self._chars: dict[str, BleakGATTCharacteristic] = {}  # Caractéristiques résolues par UUID
+        self._writable_uuids: frozenset[str] = frozenset()  # Caractéristiques inscriptibles
+        self._services_stale = False  # Forcer une redécouverte GATT à la prochaine connexion
+        self._mtu = 23  # MTU ATT négocié (23 par défaut, soit 20 octets utiles)
+        self._lock = asyncio.Lock()  # Sérialise les échanges GATT sur l'unique connexion
+        self._connect_lock = asyncio.Lock()  # Empêche connexions/déconnexions concurrentes
+        self._last_activity = 0.0  # Horodatage (boucle) du dernier échange GATT
+        self._reconnect_attempt = 0  # Échecs de reconnexion consécutifs (backoff)
+        self._pending: dict[tuple[str, str], asyncio.Task] = {}  # Envois en cours par (cmd, value)
+        self._notify_subscribed = False  # Abonnement aux notifications actif sur la connexion courante
+        self._response_event = asyncio.Event()  # Levé à chaque notification reçue du bidet
+        self._link_lost = asyncio.Event()  # Levé par une déconnexion pour réveiller le maintien de connexion
+        self._preferred_format: str | None = None  # Format de trame ("new"/"old") ayant obtenu une réponse
+        self._read_cache: dict[str, tuple[float, bytes]] = {}  # Dernière lecture par UUID (horodatage, valeur)
+        self._closing = False  # Coordinateur en cours de fermeture (déchargement/arrêt): plus de reconnexion
+        self._connect_task: asyncio.Task | None = None  # Établissement de connexion en cours (annulé par close())
 
     async def connect(self) -> bool:
         """Établir la connexion avec le bidet."""
-        try:
-            def disconnected_callback(client: BleakClient):
-                """Gérer la déconnexion."""
-                self.connected = False
-                for callback in self._disconnect_callbacks:
-                    callback()
+        async with self._connect_lock:
+            if self._closing:
+                # Coordinateur fermé (déchargement/arrêt): ne pas rouvrir de connexion
+                return False
+            if self.client and self.connected:
+                return True
+            if self.client:
+                # Ancien client (écriture bloquée, lien rompu): le libérer avant d'en créer un nouveau
+                stale, self.client = self.client, None
+                try:
+                    await stale.disconnect()
+                except Exception as err:
+                    _LOGGER.debug("Libération de l'ancien client impossible: %s", err)
 
             try:
-                ble_device = bluetooth.async_ble_device_from_address(
-                    self.hass, self.address, connectable=True
+                def disconnected_callback(client: BleakClient):
+                    """Gérer la déconnexion."""
+                    if client is not self.client:
+                        # Client déjà détaché (déconnexion volontaire, libération d'un client périmé):
+                        # disconnect() a remis l'état à zéro, ne pas toucher à la connexion courante
+                        return
+                    self.connected = False
+                    self._notify_subscribed = False
+                    self._services_dumped = False
+                    self._index_characteristics(None)
+                    # Coupure inattendue du client courant: réveiller le maintien de connexion
+                    if not self._closing:
+                        self._link_lost.set()
+                    self._run_callbacks(self._disconnect_callbacks)
+
+                try:
+                    ble_device = bluetooth.async_ble_device_from_address(
+                        self.hass, self.address, connectable=True
+                    )
+                    if not ble_device:
+                        _LOGGER.error("Impossible de trouver l'appareil: %s", self.address)
+                        return False
+                except Exception as err:
+                    _LOGGER.error("Erreur lors de la recherche de l'appareil %s: %s", self.address, err)
+                    return False
+
+                # Revenir aux paramètres d'origine qui fonctionnaient; le délai global couvre
+                # les CONNECT_ATTEMPTS tentatives du connecteur sans interrompre la dernière
+                # Tâche dédiée: close() peut l'annuler sans attendre la fin des tentatives
+                self._connect_task = self.hass.async_create_task(
+                    establish_connection(
+                        client_class=BleakClient,
+                        device=ble_device,
+                        name=self.address,
+                        disconnected_callback=disconnected_callback,
+                        # Redemander à HA le meilleur adaptateur (avec un slot libre) à chaque tentative
+                        ble_device_callback=lambda: bluetooth.async_ble_device_from_address(
+                            self.hass, self.address, connectable=True
+                        ) or ble_device,
+                        max_attempts=CONNECT_ATTEMPTS,
+                        # Cache des services, sauf si une caractéristique attendue s'est révélée introuvable
+                        use_services_cache=not self._services_stale,
+                    )
                 )
-                if not ble_device:
-                    _LOGGER.error("Impossible de trouver l'appareil: %s", self.address)
+                try:
+                    async with asyncio.timeout(CONNECT_TIMEOUT):
+                        self.client = await self._connect_task
+                except asyncio.CancelledError:
+                    # Connexion abandonnée par close(): seul l'appelant lui-même annulé propage l'annulation
+                    if asyncio.current_task().cancelling():
+                        raise
+                    _LOGGER.debug("Connexion à %s abandonnée (fermeture du coordinateur)", self.address)
                     return False
-            except Exception as err:
-                _LOGGER.error("Erreur lors de la recherche de l'appareil %s: %s", self.address, err)
-                return False
+                finally:
+                    self._connect_task = None
+                self._services_stale = False
 
-            # Revenir aux paramètres d'origine qui fonctionnaient
-            self.client = await establish_connection(
-                client_class=BleakClient,
-                device=ble_device,
-                name=self.address,
-                disconnected_callback=disconnected_callback,
-                use_services_cache=True,  # Réactivation du cache
-            )
-            
-            # La connexion a réussi, ne pas faire de vérifications supplémentaires
-            self.connected = True
-            return True
-        except (BleakError, BleakNotFoundError) as error:
-            _LOGGER.error("Erreur de connexion à %s: %s", self.address, error)
-            self.connected = False
-            return False
+                # Négocier le MTU une fois (BlueZ ne l'obtient sinon qu'à la première écriture)
+                backend = getattr(self.client, "_backend", None)
+                if hasattr(backend, "_acquire_mtu"):
+                    try:
+                        await backend._acquire_mtu()
+                    except Exception as err:
+                        _LOGGER.debug("Négociation du MTU impossible: %s", err)
+                self._mtu = self.client.mtu_size
+
+                # La connexion a réussi: indexer une fois les caractéristiques déjà résolues par bleak
+                self.connected = True
+                self._index_characteristics(getattr(self.client, "services", None))
+
+                # S'abonner aux notifications une fois pour toute la durée de la connexion
+                try:
+                    await self._subscribe_notifications()
+                except Exception as err:
+                    _LOGGER.warning("⚡ Échec de l'abonnement aux notifications: %s", err)
+
+                self._run_callbacks(self._connect_callbacks)
+                return True
+            except (BleakError, BleakNotFoundError) as error:
+                _LOGGER.error("Erreur de connexion à %s: %s", self.address, error)
+                self.connected = False
+                return False
+            except TimeoutError:
+                _LOGGER.warning("Délai de connexion à %s dépassé (%s s)", self.address, CONNECT_TIMEOUT)
+                self.connected = False
+                return False
 
     async def disconnect(self) -> None:
         """Déconnecter le bidet."""
-        if self.client:
-            await self.client.disconnect()
-            self.client = None
-        self.connected = False
+        async with self._connect_lock:
+            was_connected = self.connected
+            if self.client:
+                # Détacher le client avant la déconnexion: le callback la reconnaît comme volontaire
+                client, self.client = self.client, None
+                await client.disconnect()
+            self.connected = False
+            self._notify_subscribed = False
+            self._services_dumped = False
+            self._index_characteristics(None)
+            if was_connected:
+                # Le callback de bleak ignore ce client détaché: prévenir nous-mêmes les entités
+                self._run_callbacks(self._disconnect_callbacks)
+
+    async def close(self) -> None:
+        """Fermer définitivement le coordinateur (déchargement de l'entrée, arrêt de Home Assistant)."""
+        self._closing = True
+        # Réveiller le maintien de connexion pour qu'il se termine sans se reconnecter
+        self._link_lost.set()
+        # Abandonner une connexion en cours plutôt que d'attendre ses tentatives pour la refermer ensuite
+        if self._connect_task:
+            self._connect_task.cancel()
+        await self.disconnect()
+
+    def _backoff_delay(self) -> float:
+        """Délai avant la prochaine tentative de connexion (backoff exponentiel à gigue complète)."""
+        # Gigue complète: évite que plusieurs appels ne martèlent le bidet en même temps
+        return random.uniform(
+            0, min(RECONNECT_BACKOFF_MAX, RECONNECT_BACKOFF_BASE * 2 ** self._reconnect_attempt)
+        )
+
+    async def _try_connect(self) -> bool:
+        """Une tentative de connexion, comptée dans les échecs consécutifs du backoff."""
+        try:
+            if await self.connect():
+                self._reconnect_attempt = 0
+                return True
+        except Exception as err:
+            _LOGGER.error("Erreur lors de la reconnexion: %s", err)
+        self._reconnect_attempt = min(self._reconnect_attempt + 1, RECONNECT_MAX_EXPONENT)
+        return False
+
+    async def _ensure_connected(self) -> bool:
+        """Se (re)connecter si besoin, avec un backoff exponentiel à gigue complète en cas d'échec."""
+        if self.client and self.connected:
+            return True
+        for attempt in range(2):
+            if attempt:
+                delay = self._backoff_delay()
+                _LOGGER.debug("Nouvelle tentative de connexion dans %.1f s", delay)
+                await asyncio.sleep(delay)
+            if await self._try_connect():
+                return True
+        return False
+
+    async def keepalive(self) -> None:
+        """Garder le lien BLE chaud: lecture légère périodique, reconnexion dès que le lien tombe.
+
+        Rétablir le lien ici, hors de tout appel de service, évite qu'un appui sur le bouton
+        juste après une coupure n'ait à payer toute la reconnexion.
+        """
+        while not self._closing:
+            wait = KEEPALIVE_INTERVAL
+            if self._reconnect_attempt and not self.connected:
+                # Bidet injoignable: espacer les tentatives au-delà de l'intervalle de maintien
+                wait += self._backoff_delay()
+            try:
+                async with asyncio.timeout(wait):
+                    await self._link_lost.wait()
+            except TimeoutError:
+                pass
+            self._link_lost.clear()
+            if self._closing:
+                return
+            try:
+                if not self.client or not self.connected:
+                    await self._try_connect()
+                    continue
+                if self.hass.loop.time() - self._last_activity < KEEPALIVE_INTERVAL:
+                    # Le lien a servi récemment: inutile de le solliciter
+                    continue
+                probe_uuid = self.notify_char_uuid or OLD_CHARACTERISTIC_UUID
+                if "read" not in getattr(self._char(probe_uuid), "properties", ()):
+                    # Caractéristique non lisible (ou non indexée): pas de sonde, le lien reste tel quel
+                    continue
+                async with self._lock:
+                    await self._read(probe_uuid)
+            except Exception as err:
+                # Lecture non critique: on ne coupe le lien que s'il est réellement tombé
+                if self.client and self.client.is_connected:
+                    _LOGGER.debug("Lecture de maintien de connexion impossible: %s", err)
+                    continue
+                _LOGGER.debug("Maintien de connexion en échec (%s), reconnexion au prochain cycle", err)
+                try:
+                    await self.disconnect()
+                except Exception as disconnect_err:
+                    _LOGGER.debug("Déconnexion après échec du maintien impossible: %s", disconnect_err)
+
+    @staticmethod
+    def _run_callbacks(callbacks: set[Callable[[], None]]) -> None:
+        """Appeler chaque callback sur une copie figée; un callback en erreur n'empêche pas les autres."""
+        for cb in tuple(callbacks):
+            try:
+                cb()
+            except Exception:
+                _LOGGER.exception("Erreur dans un callback de connexion du bidet")
+
+    def add_connect_callback(self, callback):
+        """Ajouter un callback à appeler lorsque la connexion est établie."""
+        self._connect_callbacks.add(callback)
+
+    def remove_connect_callback(self, callback):
+        """Supprimer un callback de connexion."""
+        self._connect_callbacks.discard(callback)
 
     def add_disconnect_callback(self, callback):
         """Ajouter un callback à appeler lors de la déconnexion."""
-        self._disconnect_callbacks.append(callback)
+        self._disconnect_callbacks.add(callback)
 
     def remove_disconnect_callback(self, callback):
         """Supprimer un callback."""
-        if callback in self._disconnect_callbacks:
-            self._disconnect_callbacks.remove(callback)
+        self._disconnect_callbacks.discard(callback)
 
-    async def _select_characteristics(self) -> None:
-        """Détecter et sélectionner la bonne caractéristique (FFF1 nouveau, FFE1 ancien)."""
-        try:
-            # Essayer d'utiliser le cache des services si disponible
-            try:
-                services = await self.client.get_services()
-            except Exception:
-                services = getattr(self.client, "services", None)
+    def _index_characteristics(self, services) -> None:
+        """Indexer les caractéristiques (objets résolus, propriétés d'écriture) une fois par connexion."""
+        chars = {}
+        writable = set()
+        ack_write_uuids = set()
+        if services:
+            for service in services:
+                for char in getattr(service, "characteristics", []):
+                    try:
+                        uuid = str(char.uuid).lower()
+                        props = getattr(char, "properties", [])
+                        chars[uuid] = char
+                        if "write-without-response" in props:
+                            writable.add(uuid)
+                        elif "write" in props:
+                            writable.add(uuid)
+                            ack_write_uuids.add(uuid)
+                    except Exception:
+                        pass
 
-            char_uuids = set()
-            if services:
+            # Liste complète des services, une seule fois par connexion et uniquement en DEBUG
+            if not self._services_dumped and _LOGGER.isEnabledFor(logging.DEBUG):
                 for service in services:
+                    _LOGGER.debug("🔍 Service %s", service.uuid)
                     for char in getattr(service, "characteristics", []):
-                        try:
-                            char_uuids.add(str(char.uuid).lower())
-                        except Exception:
-                            pass
+                        _LOGGER.debug("🔍   Caractéristique %s %s", char.uuid, char.properties)
+                self._services_dumped = True
+
+        self._chars = chars
+        self._read_cache = {}
+        self._writable_uuids = frozenset(writable)
+        self._ack_write_uuids = ack_write_uuids
+
+    async def _select_characteristics(self) -> None:
+        """Détecter et sélectionner la bonne caractéristique (FFF1 nouveau, FFE1 ancien)."""
+        try:
+            if not self._chars:
+                # Services déjà résolus par bleak à la connexion (cache BlueZ): aucune redécouverte
+                self._index_characteristics(getattr(self.client, "services", None))
+            char_uuids = self._chars.keys()
 
             preferred = CHARACTERISTIC_UUID.lower()
             fallback = OLD_CHARACTERISTIC_UUID.lower()
@@ -143,596 +484,770 @@ class BidetCoordinator:
             if not self.notify_char_uuid:
                 self.notify_char_uuid = OLD_CHARACTERISTIC_UUID
 
-    async def send_command(self, cmd: str, value: str) -> bool:
-        """Envoyer une commande au bidet."""
-        _LOGGER.info("⭐ Tentative d'activation de la chasse d'eau avec séquence exacte de l'application")
-        
-        # S'assurer que nous sommes connectés
-        if not self.client or not self.connected:
-            try:
-                if not await self.connect():
-                    _LOGGER.error("Impossible de se connecter pour envoyer la commande")
-                    return False
-            except Exception as err:
-                _LOGGER.error("Erreur lors de la reconnexion: %s", err)
-                return False
-        
-        # Déterminer la caractéristique si nécessaire (préférence FFF1, sinon FFE1)
-        if not self.write_char_uuid or not self.notify_char_uuid:
+    def _char(self, char_uuid: str) -> BleakGATTCharacteristic | str:
+        """Caractéristique résolue à la connexion, ou l'UUID brut si elle n'a pas été indexée."""
+        return self._chars.get(char_uuid.lower(), char_uuid)
+
+    async def _read(self, char_uuid: str) -> bytes:
+        """Lire une caractéristique, au plus READ_TIMEOUT secondes (le verrou GATT ne reste jamais bloqué)."""
+        try:
+            async with asyncio.timeout(READ_TIMEOUT):
+                value = bytes(await self.client.read_gatt_char(self._char(char_uuid)))
+        except TimeoutError:
+            # Lecture bloquée: le lien est considéré comme perdu, reconnexion au prochain envoi
+            _LOGGER.warning("Délai de lecture sur %s dépassé (%s s)", char_uuid, READ_TIMEOUT)
+            self.connected = False
+            raise
+        self._last_activity = self.hass.loop.time()
+        return value
+
+    async def _read_cached(self, char_uuid: str) -> bytes:
+        """Lire une caractéristique, en réutilisant une lecture de moins de READ_CACHE_TTL secondes."""
+        uuid = char_uuid.lower()
+        now = self.hass.loop.time()
+        cached = self._read_cache.get(uuid)
+        if cached and now - cached[0] < READ_CACHE_TTL:
+            return cached[1]
+        value = await self._read(char_uuid)
+        self._read_cache[uuid] = (now, value)
+        return value
+
+    async def _subscribe_notifications(self) -> None:
+        """Activer les notifications du bidet si ce n'est pas déjà fait sur cette connexion."""
+        if self._notify_subscribed:
+            return
+        if not self.notify_char_uuid:
             await self._select_characteristics()
+        await self.client.start_notify(self._char(self.notify_char_uuid), self._notification_handler)
+        self._notify_subscribed = True
+        _LOGGER.info("⚡ Notifications activées sur %s", self.notify_char_uuid)
 
-        # 1. ÉTAPE CRUCIALE - S'abonner aux notifications AVANT d'envoyer des commandes
-        # C'est exactement ce que fait l'application originale
+    async def _wait_response(self) -> bool:
+        """Attendre la prochaine notification du bidet, au plus RESPONSE_TIMEOUT secondes."""
         try:
-            _LOGGER.info("⚡ 1) ACTIVATION DES NOTIFICATIONS (étape cruciale selon l'application originale)")
-            
-            # L'application utilise la caractéristique FFE1 pour les notifications
-            await self.client.start_notify(
-                self.notify_char_uuid, 
-                self._notification_handler
-            )
-            _LOGGER.info("⚡ Notifications activées avec succès - Le bidet peut maintenant recevoir des commandes")
-            await asyncio.sleep(0.5)  # Attendre que le mode notification soit stable
-            
-            # L'app originale fait d'abord une lecture après s'être abonnée
-            try:
-                _LOGGER.info("⚡ 2) LECTURE de l'état initial comme dans l'application originale")
-                value_bytes = await self.client.read_gatt_char(self.notify_char_uuid)
-                _LOGGER.info("⚡ Valeur actuelle: %s", value_bytes.hex() if value_bytes else "Aucune valeur")
-                await asyncio.sleep(0.3)
-            except Exception as err:
-                _LOGGER.info("⚡ Lecture non critique impossible: %s", err)
+            async with asyncio.timeout(RESPONSE_TIMEOUT):
+                await self._response_event.wait()
+        except TimeoutError:
+            _LOGGER.debug("⚡ Pas de notification de retour dans le délai imparti")
+            return False
+        return True
+
+    async def send_command(self, cmd: str, value: str) -> bool:
+        """Envoyer une commande au bidet.
+
+        Les appels identiques simultanés (appuis répétés, automatisations) partagent le même envoi BLE.
+        """
+        key = (cmd, value)
+        task = self._pending.get(key)
+        if task is None:
+            task = self.hass.async_create_task(self._send_command(cmd, value))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        else:
+            _LOGGER.debug("Commande %s/%s déjà en cours, regroupement avec l'envoi existant", cmd, value)
+        return await asyncio.shield(task)
+
+    async def _send_command(self, cmd: str, value: str) -> bool:
+        """Envoyer réellement une commande au bidet."""
+        _LOGGER.debug("⭐ Tentative d'activation de la chasse d'eau avec séquence exacte de l'application")
+
+        # S'assurer que nous sommes connectés (reconnexion et backoff hors du verrou GATT)
+        if not await self._ensure_connected():
+            _LOGGER.error("Impossible de se connecter pour envoyer la commande")
+            return False
 
-            # 2a. PING initial (optionnel, comme dans l'app)
+        async with self._lock:
+            if not self.client or not self.connected:
+                _LOGGER.error("Connexion perdue avant l'envoi de la commande")
+                return False
+
+            # Déterminer la caractéristique si nécessaire (préférence FFF1, sinon FFE1)
+            if not self.write_char_uuid or not self.notify_char_uuid:
+                await self._select_characteristics()
+
+            # 1. ÉTAPE CRUCIALE - S'abonner aux notifications AVANT d'envoyer des commandes
+            # C'est exactement ce que fait l'application originale; l'abonnement est fait à la connexion
+            # et persiste, il n'est refait ici que s'il avait échoué
             try:
-                await self._maybe_send_ping()
+                await self._subscribe_notifications()
+
+                # 2a. PING initial (optionnel, comme dans l'app)
+                try:
+                    await self._maybe_send_ping()
+                except Exception as err:
+                    _LOGGER.debug("Ignorer échec ping initial: %s", err)
+
+                # 2b. PRÉ-AUTHENTIFICATION basée sur le challenge (avant l'envoi de la commande)
+                try:
+                    auth_cmds = []
+                    chal = self.last_notification_data
+                    if chal:
+                        _LOGGER.info("🔐 Challenge lu: %s", _LazyHex(chal))
+                        if chal.startswith(_AUTH_CHALLENGE_PREFIX):
+                            # Variante standard observée dans l'app: d8 b6 73 09 + 7b 01
+                            auth_cmds.append(_AUTH_STANDARD)
+                            # Variante préfixe simple: d8 b6 73 + 7b 01
+                            auth_cmds.append(_AUTH_PREFIX_ONLY)
+                        # Variante écho des 6 premiers octets du challenge + 7b01
+                        if len(chal) >= 6:
+                            auth_cmds.append(chal[:6] + _AUTH_SUFFIX)
+
+                    if auth_cmds:
+                        _LOGGER.info(
+                            "🔐 Pré-auth: écriture %s sur %s",
+                            ", ".join(auth.hex() for auth in auth_cmds), self.write_char_uuid,
+                        )
+                        self._response_event.clear()
+                        await self._send_commands_batch(auth_cmds, self.write_char_uuid)
+                        await self._wait_response()
+                except Exception as err:
+                    _LOGGER.warning("🔐 Échec de la pré-authentification: %s", err)
+
             except Exception as err:
-                _LOGGER.debug("Ignorer échec ping initial: %s", err)
+                _LOGGER.warning("⚡ Échec de l'abonnement aux notifications: %s", err)
+                # Continuer quand même, certains appareils fonctionnent sans notifications
 
-            # 2b. PRÉ-AUTHENTIFICATION basée sur le challenge (avant l'envoi de la commande)
+            # 3. PRÉPARATION DE LA COMMANDE EXACTE (comme dans l'application décompilée)
+            # Dans l'app, la commande de chasse d'eau est une instance de CmdBean avec:
+            # - type: paramètre du constructeur
+            # - cmd: 7b (commande flush)
+            # - value: 01 (valeur pour activer)
+
+            # Construction de la commande en utilisant les constantes définies dans const.py
+            # Utilisation du protocole exact défini dans l'APK
+            full_cmd = self._build_new_frame(cmd, value)
+            old_full_cmd = self._build_old_frame(cmd, value)
+            # Le détail trame par trame n'est formaté (hex) que si le niveau DEBUG est actif
+            debug = _LOGGER.isEnabledFor(logging.DEBUG)
+            if debug:
+                _LOGGER.debug("⚡ 3) FORMATS DE COMMANDE: Nouveau=%s, Ancien=%s", full_cmd.hex(), old_full_cmd.hex())
+
+            # 4. ENVOI DE LA COMMANDE - Exactement comme l'app le fait
             try:
-                auth_cmds = []
-                chal = self.last_notification_data
-                if chal:
-                    _LOGGER.info("🔐 Challenge lu: %s", chal)
-                    if chal.startswith("d8b673"):
-                        # Variante standard observée dans l'app: d8 b6 73 09 + 7b 01
-                        auth_cmds.append(bytes.fromhex("d8b673097b01"))
-                        # Variante préfixe simple: d8 b6 73 + 7b 01
-                        auth_cmds.append(bytes.fromhex("d8b6737b01"))
-                    # Variante écho des 6 premiers octets du challenge + 7b01
-                    if len(chal) >= 12:
-                        auth_cmds.append(bytes.fromhex(chal[:12] + "7b01"))
-
-                for auth in auth_cmds:
-                    _LOGGER.info("🔐 Pré-auth: écriture %s sur %s", auth.hex(), self.write_char_uuid)
-                    await self.client.write_gatt_char(self.write_char_uuid, auth, response=False)
-                    await asyncio.sleep(0.4)
+                # L'application utilise toujours la caractéristique FFE1
+                # En analysant MainActivity.java, l'app ne fait pas d'essais-erreurs,
+                # elle envoie directement à la caractéristique trouvée
+                _LOGGER.debug("⚡ 4) ENVOI sur la caractéristique: %s", self.write_char_uuid)
+
+                # Essayons les deux formats de commande l'un après l'autre
+                # D'abord le nouveau format (celui qui utilise CMD_PROTOCOL 0006)
+                # Essais multi-caractéristiques (FFF1 et FFE1) et répétitions pour fiabiliser
+                # Commencer par la dernière caractéristique ayant fonctionné, sinon la write_char_uuid
+                # choisie, puis FFF1 et FFE1 si différents. On s'arrête au premier succès.
+                # Parmi les replis, privilégier ceux qui acceptent write-without-response (pas d'ACK GATT)
+                first = self._working_uuid or self.write_char_uuid
+                candidates = [first]
+                candidates.extend(sorted(
+                    (
+                        u for u in _WRITE_UUIDS
+                        if u != first and (not self._writable_uuids or u in self._writable_uuids)
+                    ),
+                    key=lambda u: u in self._ack_write_uuids,
+                ))
+
+                # Seules les notifications consécutives à cet envoi comptent comme réponse
+                self._response_event.clear()
+                waited = False
+                for cu in candidates:
+                    try:
+                        if cu == OLD_CHARACTERISTIC_UUID or self.write_char_uuid == OLD_CHARACTERISTIC_UUID:
+                            # Priorité ANCIEN protocole sur modèles FFE1: impulsion ON->OFF->ON
+                            if debug:
+                                _LOGGER.debug("⚡ 4a) Priorité ANCIEN format (0001) sur %s: %s", cu, old_full_cmd.hex())
+                            await self._write(cu, old_full_cmd)
+                            await asyncio.sleep(0.35)
+                            # Certains firmwares exigent une bascule rapide
+                            old_off_cmd = self._build_old_frame(cmd, VAL_FLUSH_OFF)
+                            if debug:
+                                _LOGGER.debug("⚡ 4a') Impulsion OFF (0001) sur %s: %s", cu, old_off_cmd.hex())
+                            await self._write(cu, old_off_cmd)
+                            await asyncio.sleep(0.35)
+                            # Renvoi ON
+                            if debug:
+                                _LOGGER.debug("⚡ 4a'') Renvoi ON (0001) sur %s: %s", cu, old_full_cmd.hex())
+                            await self._write(cu, old_full_cmd)
+                        else:
+                            # Format ayant déjà obtenu une réponse en premier; l'autre seulement à défaut
+                            formats = (("new", full_cmd), ("old", old_full_cmd))
+                            if self._preferred_format == "old":
+                                formats = formats[::-1]
+                            for name, frame in formats:
+                                if debug:
+                                    _LOGGER.debug("⚡ 4a) Essai (char=%s) format %s: %s", cu, name, frame.hex())
+                                self._response_event.clear()
+                                await self._write(cu, frame)
+                                if await self._wait_response():
+                                    self._preferred_format = name
+                                    break
+                            waited = True
+                        self._working_uuid = cu
+                        _LOGGER.info("⚡ Commande %s/%s envoyée sur %s", cmd, value, cu)
+                        break
+                    except BleakError as err:
+                        if cu == self._working_uuid:
+                            self._working_uuid = None
+                        if isinstance(err, BleakCharacteristicNotFoundError):
+                            self._services_stale = True
+                        if not self.client or not self.client.is_connected:
+                            # Lien BLE rompu: inutile d'essayer les autres caractéristiques
+                            _LOGGER.error("Connexion perdue pendant l'écriture sur %s: %s", cu, err)
+                            self.connected = False
+                            return False
+                        _LOGGER.debug("⚠️ Échec d'écriture sur %s: %s", cu, err)
+                    except TimeoutError:
+                        # Écriture bloquée (_write a déjà marqué le lien comme perdu): ne pas insister
+                        if cu == self._working_uuid:
+                            self._working_uuid = None
+                        return False
+                    except ValueError as err:
+                        _LOGGER.debug("⚠️ Échec d'écriture sur %s: %s", cu, err)
+                        if cu == self._working_uuid:
+                            self._working_uuid = None
+                else:
+                    if self._services_stale:
+                        # Aucune caractéristique trouvée: le cache GATT est périmé, on le redécouvrira
+                        _LOGGER.warning("Caractéristiques introuvables, redécouverte des services à la prochaine connexion")
+                        await self.disconnect()
+                    else:
+                        _LOGGER.error("Commande %s/%s refusée par toutes les caractéristiques", cmd, value)
+                    return False
+
+                # L'app attend ensuite une notification de retour, levée par le handler
+                if not waited:
+                    _LOGGER.debug("⚡ 5) ATTENTE de notification retour (comme dans l'app)...")
+                    await self._wait_response()
+
+                # ÉTAPE ADDITIONNELLE CRITIQUE: Répondre à l'authentification
+                if self.last_notification_data:
+                    _LOGGER.info("🔐 Notification reçue durant la commande: %s", _LazyHex(self.last_notification_data))
+                    _LOGGER.info("🔐 Tentative de réponse d'authentification basée sur les données reçues")
+
+                    # Données de la notification reçue (probablement un challenge d'authentification)
+                    auth_challenge = self.last_notification_data
+
+                    # Construire une réponse d'authentification
+                    # Plusieurs approches possibles:
+                    auth_responses = []
+
+                    if len(auth_challenge) >= 6:
+                        # 1. Format avec écho exact des 6 premiers bytes + commande
+                        resp1 = auth_challenge[:6] + _AUTH_SUFFIX
+                        auth_responses.append(resp1)
+
+                        # 2. Format avec premier byte inversé (trouvé dans certains protocoles IoT)
+                        resp2 = bytes([auth_challenge[0] ^ 0xFF]) + auth_challenge[1:6] + _AUTH_SUFFIX
+                        auth_responses.append(resp2)
+
+                        # 3. Format avec inversion complète des 6 premiers bytes
+                        resp3 = bytes([b ^ 0xFF for b in auth_challenge[:6]]) + _AUTH_SUFFIX
+                        auth_responses.append(resp3)
+
+                    # Enchaîner toutes les variantes sans pause, puis attendre une seule réponse
+                    if auth_responses:
+                        if debug:
+                            _LOGGER.debug(
+                                "🔐 Réponses d'authentification: %s",
+                                ", ".join(auth_resp.hex() for auth_resp in auth_responses),
+                            )
+                        try:
+                            self._response_event.clear()
+                            await self._send_commands_batch(auth_responses, self.write_char_uuid)
+                            await self._wait_response()
+                        except Exception as err:
+                            _LOGGER.warning("🔐 Échec des réponses d'authentification: %s", err)
+
+                # L'application renvoie TRUE à ce moment car elle considère l'envoi réussi
+                # (indépendamment de si la chasse d'eau s'active, car cela sera confirmé par une notif)
+                return True
             except Exception as err:
-                _LOGGER.warning("🔐 Échec de la pré-authentification: %s", err)
-                
-        except Exception as err:
-            _LOGGER.warning("⚡ Échec de l'abonnement aux notifications: %s", err)
-            # Continuer quand même, certains appareils fonctionnent sans notifications
-        
-        # 3. PRÉPARATION DE LA COMMANDE EXACTE (comme dans l'application décompilée)
-        # Dans l'app, la commande de chasse d'eau est une instance de CmdBean avec:
-        # - type: paramètre du constructeur
-        # - cmd: 7b (commande flush)
-        # - value: 01 (valeur pour activer)
-        
-        # Construction de la commande en utilisant les constantes définies dans const.py
-        # Utilisation du protocole exact défini dans l'APK
-        full_cmd = self._build_new_frame(cmd, value)
-        old_full_cmd = self._build_old_frame(cmd, value)
-        _LOGGER.info("⚡ 3) FORMATS DE COMMANDE: Nouveau=%s, Ancien=%s", full_cmd.hex(), old_full_cmd.hex())
-        
-        _LOGGER.info("⚡ 3) ENVOI de la commande exacte formatée comme dans l'application: %s", full_cmd.hex())
-        
-        # 4. ENVOI DE LA COMMANDE - Exactement comme l'app le fait
-        try:
-            # L'application utilise toujours la caractéristique FFE1
-            # En analysant MainActivity.java, l'app ne fait pas d'essais-erreurs,
-            # elle envoie directement à la caractéristique trouvée
-            _LOGGER.info("⚡ 4) ENVOI sur la caractéristique: %s", self.write_char_uuid)
-            
-            # Essayons les deux formats de commande l'un après l'autre
-            # D'abord le nouveau format (celui qui utilise CMD_PROTOCOL 0006)
-            # Essais multi-caractéristiques (FFF1 et FFE1) et répétitions pour fiabiliser
-            candidates = []
+                _LOGGER.error("Erreur lors de l'envoi de la commande: %s", err)
+                self.connected = False
+                return False
+
+    async def _write(self, char_uuid: str, data: bytes) -> None:
+        """Écrire sur une caractéristique, sans accusé de réception lorsqu'elle le permet."""
+        uuid = char_uuid.lower()
+        char = self._char(char_uuid)
+        for attempt in range(WRITE_ATTEMPTS):
+            response = uuid in self._ack_write_uuids
             try:
-                # Toujours commencer par la write_char_uuid choisie
-                candidates.append(self.write_char_uuid)
-                # Tenter ensuite FFF1 puis FFE1 si différents
-                if CHARACTERISTIC_UUID not in candidates:
-                    candidates.append(CHARACTERISTIC_UUID)
-                if OLD_CHARACTERISTIC_UUID not in candidates:
-                    candidates.append(OLD_CHARACTERISTIC_UUID)
-            except Exception:
-                candidates = [self.write_char_uuid]
+                async with asyncio.timeout(WRITE_TIMEOUT):
+                    await self.client.write_gatt_char(char, data, response=response)
+                break
+            except TimeoutError:
+                # Écriture bloquée: le lien est considéré comme perdu, reconnexion au prochain envoi
+                _LOGGER.warning("Délai d'écriture sur %s dépassé (%s s)", char_uuid, WRITE_TIMEOUT)
+                self.connected = False
+                raise
+            except BleakError as err:
+                if (
+                    isinstance(err, BleakCharacteristicNotFoundError)
+                    or not self.client
+                    or not self.client.is_connected
+                    or attempt == WRITE_ATTEMPTS - 1
+                ):
+                    _LOGGER.debug("Écriture sur %s abandonnée après %d tentative(s): %s", char_uuid, attempt + 1, err)
+                    raise
+                if not response:
+                    # Écriture sans réponse refusée: repli sur une écriture acquittée, mémorisé pour la suite
+                    _LOGGER.debug("Write-without-response refusé sur %s (%s), repli avec réponse", char_uuid, err)
+                    self._ack_write_uuids.add(uuid)
+                else:
+                    # Échec transitoire (interférences, congestion): courte attente avec gigue
+                    await asyncio.sleep(random.uniform(0, 0.1 * (1 << attempt)))
+        self._last_activity = self.hass.loop.time()
 
-            for cu in candidates:
-                try:
-                    if cu == OLD_CHARACTERISTIC_UUID or self.write_char_uuid == OLD_CHARACTERISTIC_UUID:
-                        # Priorité ANCIEN protocole sur modèles FFE1: impulsion ON->OFF->ON
-                        _LOGGER.info("⚡ 4a) Priorité ANCIEN format (0001) sur %s: %s", cu, old_full_cmd.hex())
-                        await self.client.write_gatt_char(cu, old_full_cmd, response=False)
-                        await asyncio.sleep(0.35)
-                        # Certains firmwares exigent une bascule rapide
-                        old_off_cmd = self._build_old_frame(cmd, VAL_FLUSH_OFF)
-                        _LOGGER.info("⚡ 4a') Impulsion OFF (0001) sur %s: %s", cu, old_off_cmd.hex())
-                        await self.client.write_gatt_char(cu, old_off_cmd, response=False)
-                        await asyncio.sleep(0.35)
-                        # Renvoi ON
-                        _LOGGER.info("⚡ 4a'') Renvoi ON (0001) sur %s: %s", cu, old_full_cmd.hex())
-                        await self.client.write_gatt_char(cu, old_full_cmd, response=False)
-                        await asyncio.sleep(0.35)
-                    else:
-                        _LOGGER.info("⚡ 4a) Essai (char=%s) NOUVEAU format (0006): %s", cu, full_cmd.hex())
-                        await self.client.write_gatt_char(cu, full_cmd, response=False)
-                        await asyncio.sleep(0.3)
-                        # Répéter une seconde fois comme le font certaines apps IoT
-                        await self.client.write_gatt_char(cu, full_cmd, response=False)
-                        await asyncio.sleep(0.5)
-                        _LOGGER.info("⚡ 4b) Essai (char=%s) ANCIEN format (0001): %s", cu, old_full_cmd.hex())
-                        await self.client.write_gatt_char(cu, old_full_cmd, response=False)
-                        await asyncio.sleep(0.3)
-                except Exception as err:
-                    _LOGGER.debug("⚠️ Échec d'écriture sur %s: %s", cu, err)
-            
-            # L'app attend ensuite une notification de retour, mais c'est géré par le handler
-            # On attendra donc un moment pour voir si une notification arrive
-            _LOGGER.info("⚡ 5) ATTENTE de notification retour (comme dans l'app)...")
-            await asyncio.sleep(0.5)  # Attendre la notification d'authentification
-            
-            # ÉTAPE ADDITIONNELLE CRITIQUE: Répondre à l'authentification
-            if self.last_notification_data:
-                _LOGGER.info("🔐 Notification reçue durant la commande: %s", self.last_notification_data)
-                _LOGGER.info("🔐 Tentative de réponse d'authentification basée sur les données reçues")
-                
-                # Données de la notification reçue (probablement un challenge d'authentification)
-                auth_challenge = bytes.fromhex(self.last_notification_data)
-                
-                # Construire une réponse d'authentification
-                # Plusieurs approches possibles:
-                auth_responses = []
-                
-                if len(auth_challenge) >= 6:
-                    # 1. Format avec écho exact des 6 premiers bytes + commande
-                    resp1 = auth_challenge[:6] + bytes.fromhex("7b01")
-                    auth_responses.append(resp1)
-                    
-                    # 2. Format avec premier byte inversé (trouvé dans certains protocoles IoT)
-                    resp2 = bytes([auth_challenge[0] ^ 0xFF]) + auth_challenge[1:6] + bytes.fromhex("7b01")
-                    auth_responses.append(resp2)
-                    
-                    # 3. Format avec inversion complète des 6 premiers bytes
-                    resp3 = bytes([b ^ 0xFF for b in auth_challenge[:6]]) + bytes.fromhex("7b01") 
-                    auth_responses.append(resp3)
-                
-                # Essayer chaque format de réponse possible
-                for i, auth_resp in enumerate(auth_responses):
-                    try:
-                        _LOGGER.info("🔐 Essai de réponse d'authentification #%d: %s", i+1, auth_resp.hex())
-                        await self.client.write_gatt_char(self.write_char_uuid, auth_resp, response=False)
-                        await asyncio.sleep(0.5)  # Attendre entre les commandes
-                    except Exception as err:
-                        _LOGGER.warning("🔐 Échec de la réponse d'authentification #%d: %s", i+1, err)
-                        
-            # Attendre un moment pour s'assurer que le bidet a bien reçu et traité la commande
-            await asyncio.sleep(0.5)
-            
-            # L'application renvoie TRUE à ce moment car elle considère l'envoi réussi
-            # (indépendamment de si la chasse d'eau s'active, car cela sera confirmé par une notif)
-            return True
-        except Exception as err:
-            _LOGGER.error("Erreur lors de l'envoi de la commande: %s", err)
-            self.connected = False
-            return False
+    async def _send_commands_batch(self, frames: list[bytes], char_uuid: str | None = None) -> None:
+        """Enchaîner plusieurs trames sans pause intermédiaire (client connecté, self._lock tenu par l'appelant).
 
+        Les trames plus longues que la taille maximale d'écriture sans réponse (ou MTU - 3) sont découpées.
+        """
+        target = char_uuid or self._working_uuid or self.write_char_uuid
+        char = self._chars.get(target.lower())
+        max_size = getattr(char, "max_write_without_response_size", None) or self._mtu - 3
+        for frame in frames:
+            for start in range(0, len(frame), max_size):
+                await self._write(target, frame[start:start + max_size])
+
+    @callback
     def _notification_handler(self, sender, data):
-        """Gérer les notifications reçues du bidet."""
-        _LOGGER.info("🔔 NOTIFICATION REÇUE: Caractéristique %s, Données: %s", 
-                    sender, data.hex() if data else "Aucune donnée")
-        
+        """Gérer les notifications reçues du bidet (boucle d'événements, sans allocation superflue)."""
         # Stocker les données reçues - elles pourraient être importantes pour l'authentification
         if data:
-            self.last_notification_data = data.hex()
-            
-            # Si la notification contient une valeur, cela pourrait être un challenge d'authentification
-            # Comme dans MainActivity.java, nous devons peut-être y répondre avec une séquence spécifique
-            if len(data) >= 6:
-                _LOGGER.info("🔑 Possible challenge d'authentification détecté - Valeur: %s", self.last_notification_data)
+            self.last_notification_data = bytes(data)
+            self._response_event.set()
+        _LOGGER.debug("🔔 NOTIFICATION REÇUE: handle %s, Données: %s",
+                      getattr(sender, "handle", sender), _LazyHex(data) if data else "Aucune donnée")
 
-    async def send_raw_command(self, command: bytes) -> bool:
-        """Envoyer une commande brute au bidet."""
-        _LOGGER.info("Tentative d'envoi de commande brute: %s", command.hex())
-        
-        # S'assurer que nous sommes connectés
-        if not self.client or not self.connected:
+        # Si la notification contient une valeur, cela pourrait être un challenge d'authentification
+        # Comme dans MainActivity.java, nous devons peut-être y répondre avec une séquence spécifique
+        if data and len(data) >= 6:
+            _LOGGER.debug("🔑 Possible challenge d'authentification détecté - Valeur: %s", _LazyHex(data))
+
+    async def read_auth_challenge(self) -> bytes | None:
+        """Se connecter, puis activer les notifications et lire le challenge sur FFE1 sous le verrou GATT."""
+        if not await self._ensure_connected():
+            _LOGGER.error("🔐 Impossible de se connecter pour le test d'authentification")
+            return None
+
+        async with self._lock:
+            if not self.client or not self.connected:
+                _LOGGER.error("🔐 Connexion perdue avant la lecture du challenge")
+                return None
+
+            # Activer les notifications d'abord (comme dans l'app)
             try:
-                if not await self.connect():
-                    _LOGGER.error("Impossible de se connecter pour envoyer la commande")
-                    return False
+                await self._subscribe_notifications()
             except Exception as err:
-                _LOGGER.error("Erreur lors de la reconnexion: %s", err)
-                return False
-        
-        try:
-            # Approche adaptée aux découvertes de nRF Connect
-            # Sélection des caractéristiques si nécessaire (préférence FFF1, sinon FFE1)
-            if not self.write_char_uuid or not self.notify_char_uuid:
-                await self._select_characteristics()
-            # D'après les captures, nous devons d'abord activer les notifications (exact comme avant)
-            
-            # 1. ACTIVATION DES NOTIFICATIONS
-            _LOGGER.info("🔑 1) ACTIVATION DES NOTIFICATIONS sur la caractéristique %s", self.notify_char_uuid)
+                _LOGGER.warning("🔐 Échec de l'activation des notifications: %s", err)
+
+            # Lire la caractéristique pour obtenir la valeur d'authentification
             try:
-                await self.client.start_notify(self.notify_char_uuid, self._notification_handler)
+                _LOGGER.info("🔐 Lecture de la caractéristique 0xFFE1 pour obtenir le challenge")
+                # Lecture directe: un challenge doit être frais, jamais repris du cache de lecture;
+                # il y est en revanche déposé pour la lecture de send_raw_command qui suit
+                value = await self._read(OLD_CHARACTERISTIC_UUID)
+                self._read_cache[OLD_CHARACTERISTIC_UUID.lower()] = (self.hass.loop.time(), value)
             except Exception as err:
-                _LOGGER.warning("⚠️ Échec de l'activation des notifications: %s", err)
-                # Continuer malgré l'échec potentiel
-            
-            # 2. LIRE LA CARACTÉRISTIQUE (comme vu dans nRF)
-            _LOGGER.info("🔑 2) LECTURE de la caractéristique %s", self.notify_char_uuid)
+                _LOGGER.warning("🔐 Échec de la lecture: %s", err)
+                return b""
+            if value:
+                _LOGGER.info("🔐 Valeur d'authentification lue: %s", _LazyHex(value))
+            return value
+
+    async def send_raw_command(self, command: bytes) -> bool:
+        """Envoyer une commande brute au bidet."""
+        _LOGGER.info("Tentative d'envoi de commande brute: %s", _LazyHex(command))
+
+        # S'assurer que nous sommes connectés (reconnexion et backoff hors du verrou GATT)
+        if not await self._ensure_connected():
+            _LOGGER.error("Impossible de se connecter pour envoyer la commande")
+            return False
+
+        async with self._lock:
+            if not self.client or not self.connected:
+                _LOGGER.error("Connexion perdue avant l'envoi de la commande")
+                return False
+
             try:
-                value = await self.client.read_gatt_char(self.notify_char_uuid)
-                _LOGGER.info("🔑 Valeur lue: %s", value.hex() if value else "Aucune valeur")
+                # Approche adaptée aux découvertes de nRF Connect
+                # Sélection des caractéristiques si nécessaire (préférence FFF1, sinon FFE1)
+                if not self.write_char_uuid or not self.notify_char_uuid:
+                    await self._select_characteristics()
+                # D'après les captures, nous devons d'abord activer les notifications (exact comme avant)
+
+                # 1. ACTIVATION DES NOTIFICATIONS
+                try:
+                    await self._subscribe_notifications()
+                except Exception as err:
+                    _LOGGER.warning("⚠️ Échec de l'activation des notifications: %s", err)
+                    # Continuer malgré l'échec potentiel
+
+                # 2. LIRE LA CARACTÉRISTIQUE (comme vu dans nRF)
+                _LOGGER.info("🔑 2) LECTURE de la caractéristique %s", self.notify_char_uuid)
+                try:
+                    value = await self._read_cached(self.notify_char_uuid)
+                    _LOGGER.info("🔑 Valeur lue: %s", _LazyHex(value) if value else "Aucune valeur")
+                except Exception as err:
+                    _LOGGER.warning("⚠️ Échec de la lecture de la caractéristique: %s", err)
+
+                # 3. ENVOI DE LA COMMANDE avec la technique de bonding appropriée
+                target_char = self._working_uuid or self.write_char_uuid
+                _LOGGER.info("🔑 3) ÉCRITURE sur la caractéristique %s: %s", target_char, _LazyHex(command))
+                await self._write(target_char, command)
+                _LOGGER.info("✓ SUCCÈS! Commande envoyée sur %s", target_char)
+
+                # La réponse éventuelle arrive par le handler de notification, inutile de bloquer ici
+                return True
             except Exception as err:
-                _LOGGER.warning("⚠️ Échec de la lecture de la caractéristique: %s", err)
-            
-            # 3. ENVOI DE LA COMMANDE avec la technique de bonding appropriée
-            _LOGGER.info("🔑 3) ÉCRITURE sur la caractéristique %s: %s", self.write_char_uuid, command.hex())
-            await self.client.write_gatt_char(self.write_char_uuid, command, response=False)
-            _LOGGER.info("✓ SUCCÈS! Commande envoyée sur 0xFFE1")
-            
-            # 4. ATTENTE DE RÉPONSE
-            _LOGGER.info("🔑 4) ATTENTE de réponse éventuelle...")
-            await asyncio.sleep(1.0)
-            
-            return True
-        except Exception as err:
-            _LOGGER.error("❌ Erreur lors de l'envoi de la commande: %s", err)
-            return False
+                _LOGGER.error("❌ Erreur lors de l'envoi de la commande: %s", err)
+                return False
             
     async def send_raw_to_char(self, command: bytes, char_uuid: str) -> bool:
         """Envoyer une commande brute au bidet en ciblant explicitement une caractéristique d'écriture."""
-        _LOGGER.info("Tentative d'envoi (char forcée=%s): %s", char_uuid, command.hex())
-        
-        # S'assurer que nous sommes connectés
-        if not self.client or not self.connected:
-            try:
-                if not await self.connect():
-                    _LOGGER.error("Impossible de se connecter pour envoyer la commande (char forcée)")
-                    return False
-            except Exception as err:
-                _LOGGER.error("Erreur lors de la reconnexion: %s", err)
+        _LOGGER.info("Tentative d'envoi (char forcée=%s): %s", char_uuid, _LazyHex(command))
+
+        # S'assurer que nous sommes connectés (reconnexion et backoff hors du verrou GATT)
+        if not await self._ensure_connected():
+            _LOGGER.error("Impossible de se connecter pour envoyer la commande (char forcée)")
+            return False
+
+        async with self._lock:
+            if not self.client or not self.connected:
+                _LOGGER.error("Connexion perdue avant l'envoi de la commande (char forcée)")
                 return False
-        
-        try:
-            # Activer les notifications si pas déjà fait
-            if not self.notify_char_uuid:
-                await self._select_characteristics()
+
             try:
-                await self.client.start_notify(self.notify_char_uuid, self._notification_handler)
+                # Activer les notifications si pas déjà fait
+                if not self.notify_char_uuid:
+                    await self._select_characteristics()
+                try:
+                    await self._subscribe_notifications()
+                except Exception as err:
+                    _LOGGER.debug("Notify optionnelle échouée (%s): %s", self.notify_char_uuid, err)
+
+                # Écriture sur la caractéristique ciblée
+                _LOGGER.info("Écriture sur %s: %s", char_uuid, _LazyHex(command))
+                await self._write(char_uuid, command)
+                return True
             except Exception as err:
-                _LOGGER.debug("Notify optionnelle échouée (%s): %s", self.notify_char_uuid, err)
-            
-            # Écriture sur la caractéristique ciblée
-            _LOGGER.info("Écriture sur %s: %s", char_uuid, command.hex())
-            await self.client.write_gatt_char(char_uuid, command, response=False)
-            await asyncio.sleep(0.5)
-            return True
-        except Exception as err:
-            _LOGGER.error("Erreur lors de l'envoi sur %s: %s", char_uuid, err)
-            return False
+                _LOGGER.error("Erreur lors de l'envoi sur %s: %s", char_uuid, err)
+                return False
 
     def _build_legacy_s0(self, type_hex: str, dp_hex: str) -> bytes:
         """Construire la trame S0 'legacy' de la lib historique:
         Format: 'aaaa' + <len> + <type> + <dp> + '0101'
         Où len = nb_octets(<type> + <dp> + 0101)
         """
-        type_hex = (type_hex or "").lower()
-        dp_hex = (dp_hex or "").lower()
+        type_bytes = bytes.fromhex(type_hex or "")
+        dp_bytes = bytes.fromhex(dp_hex or "")
         # Longueur en octets: 1 (type) + len(dp) + 2 (0101)
-        length = 1 + len(bytes.fromhex(dp_hex)) + 2
-        length_hex = format(length, "02x")
-        payload_hex = f"aaaa{length_hex}{type_hex}{dp_hex}0101"
-        return bytes.fromhex(payload_hex)
-
-    def _build_frame(self, protocol_hex: str, cmd_hex: str, value_hex: str) -> bytes:
-        """Construire une trame 55aa avec longueur dynamique et checksum (H0) comme l'app."""
-        # Normaliser
-        protocol_hex = protocol_hex.lower()
-        cmd_hex = cmd_hex.lower()
-        value_hex = value_hex.lower()
-
-        # Données: <cmd> + 0001 + <value>
-        data_hex = f"{cmd_hex}0001{value_hex}"
-        data_len = len(bytes.fromhex(data_hex))
-        # Longueur selon T0 (smali): len = (dp bytes) + 3
-        # Exemple flush: 1 (cmd) + 2 (0001) + 1 (val) = 4 -> 4 + 3 = 7 (0x07)
-        length_hex = format(data_len + 3, "02x")
-
-        base_hex = f"55aa{protocol_hex}{length_hex}{data_hex}"
-        checksum_hex = self._calculate_checksum(base_hex)
-        return bytes.fromhex(base_hex + checksum_hex)
+        length = 1 + len(dp_bytes) + 2
+        return b"\xaa\xaa" + bytes([length]) + type_bytes + dp_bytes + b"\x01\x01"
 
     def _build_new_frame(self, cmd_hex: str, value_hex: str) -> bytes:
         """Nouveau protocole (0006)."""
-        return self._build_frame("0006", cmd_hex, value_hex)
+        return _build_hex_frame(_PROTOCOL_NEW, cmd_hex, value_hex)
 
     def _build_old_frame(self, cmd_hex: str, value_hex: str) -> bytes:
         """Ancien protocole (0001)."""
-        return self._build_frame("0001", cmd_hex, value_hex)
+        return _build_hex_frame(_PROTOCOL_OLD, cmd_hex, value_hex)
 
     async def _maybe_send_ping(self) -> None:
         """Envoyer le ping 'Q' de l'app: 55aa00000000ff (keepalive/handshake)."""
         try:
-            ping_base = "55aa00000000"
-            ping = bytes.fromhex(ping_base + self._calculate_checksum(ping_base))
-            _LOGGER.info("🔄 Ping initial (Q): %s", ping.hex())
-            await self.client.write_gatt_char(self.write_char_uuid, ping, response=False)
+            ping = _PING_FRAME
+            _LOGGER.info("🔄 Ping initial (Q): %s", _LazyHex(ping))
+            await self._write(self.write_char_uuid, ping)
             await asyncio.sleep(0.2)
         except Exception as err:
             _LOGGER.debug("Ping initial ignoré: %s", err)
 
-    def _calculate_checksum(self, cmd_str: str) -> str:
-        """Calculer le checksum selon la méthode du bidet."""
-        # Divise la commande en paires de caractères (octets en hex)
-        pairs = [cmd_str[i:i+2] for i in range(0, len(cmd_str), 2)]
-        
-        # Convertit chaque paire en entier et somme
-        sum_value = sum(int(pair, 16) for pair in pairs)
-        
-        # Prend le modulo 256 et convertit en hex
-        checksum = sum_value % 256
-        checksum_hex = format(checksum, '02x')
-        
-        return checksum_hex
 
+def _coordinator_for_device(hass: HomeAssistant, device_id: str) -> BidetCoordinator | None:
+    """Retrouver le coordinateur du bidet associé à un appareil."""
+    entry_id = _entry_id_for_device(hass, device_id)
+    if entry_id is None:
+        return None
 
-# Aucune classe de bouton n'est nécessaire car nous utiliserons une notification directe
+    coordinator = hass.data[DOMAIN].get(entry_id)
+    if not coordinator:
+        _LOGGER.error("Coordinateur non trouvé pour l'entrée %s", entry_id)
+    return coordinator
 
 
-async def async_setup(hass: HomeAssistant, config: dict) -> bool:
-    """Configurer le service d'appairage."""
-    
-    # Définir le service de préparation d'appairage
-    async def handle_prepare_pairing(call: ServiceCall) -> None:
-        """Gérer le service de préparation à l'appairage."""
-        _LOGGER.info("Service de préparation à l'appairage appelé")
-        
-        # Notification pour l'utilisateur avec les instructions simplifiées
-        hass.components.persistent_notification.create(
-            "Pour préparer votre Top Toilet / Bidet WC à la détection Bluetooth :<br><br>"
-            "1. Redémarrez votre toilette (coupez l'alimentation et rallumez)<br>"
-            "2. Assurez-vous que votre toilette est à portée du serveur Home Assistant<br><br>"
-            "Une fois ces étapes effectuées, vous pouvez ajouter l'intégration via "
-            "Paramètres → Appareils et services → Ajouter une intégration → Top Toilet / Bidet WC",
-            "Préparer votre toilette pour l'intégration",
-            "bidet_pairing_instructions"
-        )
-    
-    # Service de test pour le débogage
-    async def handle_test_command(call: ServiceCall) -> None:
-        """Gérer le service de test de commande."""
-        _LOGGER.info("🔍 Service de test de commande appelé")
-        
-        device_id = call.data.get("device_id")
-        command_type = call.data.get("command_type")
-        raw_command = call.data.get("raw_command")
-        target_char = call.data.get("target_char", "auto").lower()
-        cmd_hex = call.data.get("cmd")
-        value_hex = call.data.get("value")
-        s0_type = call.data.get("s0_type")
-        s0_dp = call.data.get("s0_dp")
-        
-        # Récupérer le device_id et trouver le coordinateur correspondant
-        device_registry = hass.helpers.device_registry.async_get(hass)
-        device = device_registry.async_get(device_id)
-        
-        if not device:
-            _LOGGER.error("🔍 Appareil non trouvé: %s", device_id)
-            return
-        
-        # Trouver l'entrée de configuration correspondante
-        for identifier in device.identifiers:
-            if identifier[0] == DOMAIN:
-                entry_id = identifier[1]
-                break
+# Caractéristiques ciblées par l'option target_char des services de test
+_TARGET_CHARS = {
+    "fff1": (CHARACTERISTIC_UUID,),
+    "ffe1": (OLD_CHARACTERISTIC_UUID,),
+    "both": (CHARACTERISTIC_UUID, OLD_CHARACTERISTIC_UUID),
+}
+
+
+async def _send_to_target(
+    coordinator: BidetCoordinator, command: bytes, target_char: str, default_uuid: str
+) -> bool:
+    """Envoyer une trame de test sur la ou les caractéristiques demandées."""
+    candidates = _TARGET_CHARS.get(target_char) or (coordinator.write_char_uuid or default_uuid,)
+    result = False
+    for cu in candidates:
+        ok = await coordinator.send_raw_to_char(command, cu)
+        result = result or ok
+    return result
+
+
+async def _run_test_command(
+    coordinator: BidetCoordinator,
+    command_type: str,
+    target_char: str = "auto",
+    cmd_hex: str | None = None,
+    value_hex: str | None = None,
+    raw_command: str | None = None,
+    s0_type: str | None = None,
+    s0_dp: str | None = None,
+) -> bool:
+    """Construire et envoyer la trame correspondant à un type de commande de test."""
+    if command_type == "flush":
+        # Commande de chasse d'eau standard
+        _LOGGER.info("🔍 Envoi commande flush")
+        return await coordinator.send_command(CMD_FLUSH, VAL_FLUSH_ON)
+
+    if command_type in ("old_format", "new_format"):
+        # Force l'ancien (builder S0) ou le nouveau format (builder T0), généré dynamiquement
+        cmd_use = cmd_hex or CMD_FLUSH
+        val_use = value_hex or VAL_FLUSH_ON
+        if command_type == "old_format":
+            command = coordinator._build_old_frame(cmd_use, val_use)
         else:
-            _LOGGER.error("🔍 Impossible de trouver l'entrée de configuration pour l'appareil %s", device_id)
-            return
-        
-        coordinator = hass.data[DOMAIN].get(entry_id)
-        if not coordinator:
-            _LOGGER.error("🔍 Coordinateur non trouvé pour l'entrée %s", entry_id)
-            return
-        
-        _LOGGER.info("🔍 Envoi de commande de test à l'appareil %s (type: %s)", device_id, command_type)
-        
+            command = coordinator._build_new_frame(cmd_use, val_use)
+        _LOGGER.info("🔍 Format %s (dyn) cmd=%s val=%s: %s", command_type, cmd_use, val_use, _LazyHex(command))
+        if target_char == "auto":
+            return await coordinator.send_raw_command(command)
+        return await _send_to_target(coordinator, command, target_char, CHARACTERISTIC_UUID)
+
+    if command_type == "legacy_s0":
+        # Envoi du format legacy 'aaaa' + len + type + dp + 0101
+        if not s0_type or not s0_dp:
+            _LOGGER.error("🔍 legacy_s0 nécessite s0_type et s0_dp (hex)")
+            return False
         try:
-            result = False
-            
-            if command_type == "flush":
-                # Commande de chasse d'eau standard
-                _LOGGER.info("🔍 Envoi commande flush")
-                result = await coordinator.send_command(CMD_FLUSH, VAL_FLUSH_ON)
-            elif command_type == "old_format":
-                # Force l'ancien format (généré dynamiquement via builder S0)
-                cmd_use = (cmd_hex or CMD_FLUSH)
-                val_use = (value_hex or VAL_FLUSH_ON)
-                command = coordinator._build_old_frame(cmd_use, val_use)
-                _LOGGER.info("🔍 Ancien format (dyn) cmd=%s val=%s: %s", cmd_use, val_use, command.hex())
-                if target_char == "auto":
-                    result = await coordinator.send_raw_command(command)
-                else:
-                    result = False
-                    candidates = []
-                    if target_char == "fff1":
-                        candidates = [CHARACTERISTIC_UUID]
-                    elif target_char == "ffe1":
-                        candidates = [OLD_CHARACTERISTIC_UUID]
-                    elif target_char == "both":
-                        candidates = [CHARACTERISTIC_UUID, OLD_CHARACTERISTIC_UUID]
-                    else:
-                        candidates = [coordinator.write_char_uuid or CHARACTERISTIC_UUID]
-                    for cu in candidates:
-                        ok = await coordinator.send_raw_to_char(command, cu)
-                        result = result or ok
-            elif command_type == "new_format":
-                # Force le nouveau format (généré dynamiquement via builder T0)
-                cmd_use = (cmd_hex or CMD_FLUSH)
-                val_use = (value_hex or VAL_FLUSH_ON)
-                command = coordinator._build_new_frame(cmd_use, val_use)
-                _LOGGER.info("🔍 Nouveau format (dyn) cmd=%s val=%s: %s", cmd_use, val_use, command.hex())
-                if target_char == "auto":
-                    result = await coordinator.send_raw_command(command)
-                else:
-                    result = False
-                    candidates = []
-                    if target_char == "fff1":
-                        candidates = [CHARACTERISTIC_UUID]
-                    elif target_char == "ffe1":
-                        candidates = [OLD_CHARACTERISTIC_UUID]
-                    elif target_char == "both":
-                        candidates = [CHARACTERISTIC_UUID, OLD_CHARACTERISTIC_UUID]
-                    else:
-                        candidates = [coordinator.write_char_uuid or CHARACTERISTIC_UUID]
-                    for cu in candidates:
-                        ok = await coordinator.send_raw_to_char(command, cu)
-                        result = result or ok
-            elif command_type == "legacy_s0":
-                # Envoi du format legacy 'aaaa' + len + type + dp + 0101
-                if not s0_type or not s0_dp:
-                    _LOGGER.error("🔍 legacy_s0 nécessite s0_type et s0_dp (hex)")
-                else:
-                    try:
-                        command = coordinator._build_legacy_s0(s0_type, s0_dp)
-                        _LOGGER.info("🔍 Legacy S0 (type=%s dp=%s): %s", s0_type, s0_dp, command.hex())
-                        # Legacy supposé écrit sur FFE1
-                        if target_char == "auto":
-                            result = await coordinator.send_raw_to_char(command, OLD_CHARACTERISTIC_UUID)
-                        else:
-                            result = False
-                            candidates = []
-                            if target_char == "fff1":
-                                candidates = [CHARACTERISTIC_UUID]
-                            elif target_char == "ffe1":
-                                candidates = [OLD_CHARACTERISTIC_UUID]
-                            elif target_char == "both":
-                                candidates = [CHARACTERISTIC_UUID, OLD_CHARACTERISTIC_UUID]
-                            else:
-                                candidates = [coordinator.write_char_uuid or OLD_CHARACTERISTIC_UUID]
-                            for cu in candidates:
-                                ok = await coordinator.send_raw_to_char(command, cu)
-                                result = result or ok
-                    except ValueError as err:
-                        _LOGGER.error("🔍 Paramètres legacy_s0 invalides (hex requis): %s", err)
-            elif command_type == "raw" and raw_command:
-                # Commande brute
-                try:
-                    # Convertir la chaîne hex en bytes
-                    command = bytes.fromhex(raw_command)
-                    _LOGGER.info("🔍 Commande brute: %s", command.hex())
-                    if target_char == "auto":
-                        result = await coordinator.send_raw_command(command)
-                    else:
-                        result = False
-                        candidates = []
-                        if target_char == "fff1":
-                            candidates = [CHARACTERISTIC_UUID]
-                        elif target_char == "ffe1":
-                            candidates = [OLD_CHARACTERISTIC_UUID]
-                        elif target_char == "both":
-                            candidates = [CHARACTERISTIC_UUID, OLD_CHARACTERISTIC_UUID]
-                        else:
-                            candidates = [coordinator.write_char_uuid or CHARACTERISTIC_UUID]
-                        for cu in candidates:
-                            ok = await coordinator.send_raw_to_char(command, cu)
-                            result = result or ok
-                except ValueError as err:
-                    _LOGGER.error("🔍 Format hexadécimal invalide: %s", err)
-            
-            _LOGGER.info("🔍 Résultat de la commande de test: %s", "Succès" if result else "Échec")
-        except Exception as err:
-            _LOGGER.error("🔍 Erreur lors de l'envoi de la commande de test: %s", err)
-    
-    # Service de test simplifié qui utilise le premier bidet configuré
-    async def handle_test_simple(call: ServiceCall) -> None:
-        """Gérer le service de test simplifié."""
-        command_type = call.data.get("command_type", "flush")
-        
-        _LOGGER.info("🔎 Service de test simplifié appelé (type: %s)", command_type)
-        
-        # Trouver le premier coordinateur bidet disponible
-        if not hass.data.get(DOMAIN):
-            _LOGGER.error("🔎 Aucune intégration bidet configurée")
-            hass.components.persistent_notification.create(
-                "Aucune intégration Bidet WC n'est configurée. Veuillez d'abord ajouter l'intégration.",
-                "Test du Bidet WC",
-                "bidet_test_error"
-            )
+            command = coordinator._build_legacy_s0(s0_type, s0_dp)
+        except ValueError as err:
+            _LOGGER.error("🔍 Paramètres legacy_s0 invalides (hex requis): %s", err)
+            return False
+        _LOGGER.info("🔍 Legacy S0 (type=%s dp=%s): %s", s0_type, s0_dp, _LazyHex(command))
+        # Legacy supposé écrit sur FFE1
+        if target_char == "auto":
+            return await coordinator.send_raw_to_char(command, OLD_CHARACTERISTIC_UUID)
+        return await _send_to_target(coordinator, command, target_char, OLD_CHARACTERISTIC_UUID)
+
+    if command_type == "raw" and raw_command:
+        # Commande brute
+        if not _HEX_RE.match(raw_command):
+            _LOGGER.error("🔍 Format hexadécimal invalide: %s", raw_command)
+            return False
+        command = bytes.fromhex(raw_command)
+        _LOGGER.info("🔍 Commande brute: %s", _LazyHex(command))
+        if target_char == "auto":
+            return await coordinator.send_raw_command(command)
+        return await _send_to_target(coordinator, command, target_char, CHARACTERISTIC_UUID)
+
+    return False
+
+
+# Définir le service de préparation d'appairage
+async def _handle_prepare_pairing(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Gérer le service de préparation à l'appairage."""
+    _LOGGER.info("Service de préparation à l'appairage appelé")
+
+    # Notification pour l'utilisateur avec les instructions simplifiées
+    persistent_notification.async_create(
+        hass, _PAIRING_MESSAGE, _PAIRING_TITLE, _PAIRING_NOTIFICATION_ID
+    )
+
+
+# Service de test pour le débogage
+async def _handle_test_command(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Gérer le service de test de commande."""
+    _LOGGER.info("🔍 Service de test de commande appelé")
+
+    device_id = call.data.get("device_id")
+    command_type = call.data.get("command_type")
+    raw_command = call.data.get("raw_command")
+    target_char = call.data.get("target_char", "auto").lower()
+    cmd_hex = call.data.get("cmd")
+    value_hex = call.data.get("value")
+    s0_type = call.data.get("s0_type")
+    s0_dp = call.data.get("s0_dp")
+
+    # Récupérer le device_id et trouver le coordinateur correspondant
+    coordinator = _coordinator_for_device(hass, device_id)
+    if coordinator is None:
+        return
+
+    _LOGGER.info("🔍 Envoi de commande de test à l'appareil %s (type: %s)", device_id, command_type)
+
+    try:
+        result = await _run_test_command(
+            coordinator, command_type, target_char, cmd_hex, value_hex, raw_command, s0_type, s0_dp
+        )
+        _LOGGER.info("🔍 Résultat de la commande de test: %s", "Succès" if result else "Échec")
+    except Exception as err:
+        _LOGGER.error("🔍 Erreur lors de l'envoi de la commande de test: %s", err)
+
+
+# Service de test simplifié qui utilise le premier bidet configuré
+async def _handle_test_simple(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Gérer le service de test simplifié."""
+    command_type = call.data.get("command_type", "flush")
+
+    _LOGGER.info("🔎 Service de test simplifié appelé (type: %s)", command_type)
+
+    # Trouver le premier coordinateur bidet disponible
+    if not hass.data.get(DOMAIN):
+        _LOGGER.error("🔎 Aucune intégration bidet configurée")
+        persistent_notification.async_create(
+            hass,
+            "Aucune intégration Bidet WC n'est configurée. Veuillez d'abord ajouter l'intégration.",
+            "Test du Bidet WC",
+            "bidet_test_error"
+        )
+        return
+
+    # Trouver le premier coordinateur
+    entry_id = next(iter(hass.data[DOMAIN].keys()))
+    coordinator = hass.data[DOMAIN][entry_id]
+
+    _LOGGER.info("🔎 Utilisation du premier bidet trouvé: %s", coordinator.address)
+
+    try:
+        result = await _run_test_command(coordinator, command_type)
+
+        message = "✅ La commande a été envoyée avec succès" if result else "❌ Échec de l'envoi de la commande"
+        _LOGGER.info("🔎 Résultat: %s", message)
+
+        # Notification du résultat
+        persistent_notification.async_create(
+            hass,
+            message,
+            "Test du Bidet WC",
+            "bidet_test_result"
+        )
+    except Exception as err:
+        _LOGGER.error("🔎 Erreur lors de l'envoi de la commande: %s", err)
+        persistent_notification.async_create(
+            hass,
+            f"Erreur lors de l'envoi de la commande: {err}",
+            "Test du Bidet WC",
+            "bidet_test_error"
+        )
+
+
+# Service de test des mécanismes d'authentification
+async def _handle_test_auth(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Tester différentes variantes d'authentification."""
+    _LOGGER.info("🔐 Service de test d'authentification appelé")
+
+    device_id = call.data.get("device_id")
+    auth_variant = call.data.get("auth_variant", "standard")
+
+    # Récupérer le coordinateur pour l'appareil
+    coordinator = _coordinator_for_device(hass, device_id)
+    if coordinator is None:
+        return
+
+    _LOGGER.info("🔐 Test d'authentification sur l'appareil %s (variante: %s)", device_id, auth_variant)
+
+    try:
+        # Connexion, notifications et lecture du challenge sérialisées avec les autres échanges GATT
+        auth_value = await coordinator.read_auth_challenge()
+        if auth_value is None:
             return
-        
-        # Trouver le premier coordinateur
-        entry_id = next(iter(hass.data[DOMAIN].keys()))
-        coordinator = hass.data[DOMAIN][entry_id]
-        
-        _LOGGER.info("🔎 Utilisation du premier bidet trouvé: %s", coordinator.address)
-        
-        try:
-            result = False
-            
-            if command_type == "flush":
-                # Commande de chasse d'eau standard
-                _LOGGER.info("🔎 Envoi commande flush")
-                result = await coordinator.send_command(CMD_FLUSH, VAL_FLUSH_ON)
-            elif command_type == "old_format":
-                # Force l'ancien format (généré dynamiquement via builder S0)
-                cmd_use = CMD_FLUSH
-                val_use = VAL_FLUSH_ON
-                command = coordinator._build_old_frame(cmd_use, val_use)
-                _LOGGER.info("🔎 Envoi commande ancien format (dyn) cmd=%s val=%s: %s", cmd_use, val_use, command.hex())
-                result = await coordinator.send_raw_command(command)
-            elif command_type == "new_format":
-                # Force le nouveau format (généré dynamiquement via builder T0)
-                cmd_use = CMD_FLUSH
-                val_use = VAL_FLUSH_ON
-                command = coordinator._build_new_frame(cmd_use, val_use)
-                _LOGGER.info("🔎 Envoi commande nouveau format (dyn) cmd=%s val=%s: %s", cmd_use, val_use, command.hex())
-                result = await coordinator.send_raw_command(command)
-            
-            message = "✅ La commande a été envoyée avec succès" if result else "❌ Échec de l'envoi de la commande"
-            _LOGGER.info("🔎 Résultat: %s", message)
-            
-            # Notification du résultat
-            hass.components.persistent_notification.create(
-                message,
-                "Test du Bidet WC",
-                "bidet_test_result"
-            )
-        except Exception as err:
-            _LOGGER.error("🔎 Erreur lors de l'envoi de la commande: %s", err)
-            hass.components.persistent_notification.create(
-                f"Erreur lors de l'envoi de la commande: {err}",
-                "Test du Bidet WC",
-                "bidet_test_error"
-            )
+
+        # Préparer la commande selon la variante choisie
+        command = None
+
+        if auth_variant in _AUTH_VARIANTS:
+            _LOGGER.info("🔐 Utilisation du format d'authentification %s", auth_variant)
+            command = _AUTH_VARIANTS[auth_variant]
+
+        elif auth_variant == "challenge":
+            # Utiliser la valeur lue comme base pour la réponse d'authentification
+            if auth_value and len(auth_value) >= 6:
+                _LOGGER.info("🔐 Utilisation de l'authentification par challenge-response")
+                # Extraire les 6 premiers octets et ajouter la commande
+                command = auth_value[:6] + _AUTH_SUFFIX
+            else:
+                _LOGGER.error("🔐 Impossible d'utiliser l'authentification par challenge: valeur non disponible")
+                return
+
+        if command:
+            _LOGGER.info("🔐 Envoi de la commande d'authentification: %s", _LazyHex(command))
+            result = await coordinator.send_raw_command(command)
+
+            if result:
+                _LOGGER.info("🔐 La commande d'authentification a été envoyée avec succès")
+                persistent_notification.async_create(
+                    hass,
+                    f"La commande d'authentification a été envoyée avec succès.\n"
+                    f"Variante: {auth_variant}\n"
+                    f"Commande: {command.hex()}\n\n"
+                    f"Vérifiez si votre bidet a réagi.",
+                    "Test d'authentification",
+                    "bidet_auth_test"
+                )
+            else:
+                _LOGGER.error("🔐 Échec de l'envoi de la commande d'authentification")
+                persistent_notification.async_create(
+                    hass,
+                    f"Échec de l'envoi de la commande d'authentification.\n"
+                    f"Variante: {auth_variant}\n"
+                    f"Commande: {command.hex() if command else 'N/A'}",
+                    "Test d'authentification",
+                    "bidet_auth_test"
+                )
+        else:
+            _LOGGER.error("🔐 Aucune commande générée pour la variante %s", auth_variant)
+
+    except Exception as err:
+        _LOGGER.error("🔐 Erreur lors du test d'authentification: %s", err)
+        persistent_notification.async_create(
+            hass,
+            f"Erreur lors du test d'authentification: {err}",
+            "Test d'authentification",
+            "bidet_auth_test"
+        )
+
+
+# Chasse d'eau simultanée sur tous les bidets (une connexion BLE par coordinateur)
+async def _handle_flush_all(hass: HomeAssistant, call: ServiceCall) -> None:
+    """Déclencher la chasse d'eau sur tous les bidets configurés en parallèle."""
+    coordinators = list(hass.data[DOMAIN].values())
+    results = await asyncio.gather(
+        *(c.send_command(CMD_FLUSH, VAL_FLUSH_ON) for c in coordinators),
+        return_exceptions=True,
+    )
+    for coordinator, result in zip(coordinators, results):
+        if result is not True:
+            _LOGGER.error("Échec de la chasse d'eau sur %s: %s", coordinator.address, result)
+
+
+async def async_setup(hass: HomeAssistant, config: dict) -> bool:
+    """Configurer le service d'appairage."""
+    hass.data.setdefault(DOMAIN, {})
     
     # Enregistrer les services
     hass.services.async_register(
         DOMAIN,
         SERVICE_PREPARE_PAIRING,
-        handle_prepare_pairing,
+        partial(_handle_prepare_pairing, hass),
         schema=vol.Schema({})
     )
     
     hass.services.async_register(
         DOMAIN,
         SERVICE_TEST_COMMAND,
-        handle_test_command,
+        partial(_handle_test_command, hass),
         schema=vol.Schema({
             vol.Required("device_id"): cv.string,
             vol.Required("command_type"): vol.In(["flush", "old_format", "new_format", "legacy_s0", "raw"]),
@@ -749,179 +1264,61 @@ async def async_setup(hass: HomeAssistant, config: dict) -> bool:
     hass.services.async_register(
         DOMAIN,
         "test_simple",
-        handle_test_simple,
+        partial(_handle_test_simple, hass),
         schema=vol.Schema({
             vol.Optional("command_type", default="flush"): vol.In(["flush", "old_format", "new_format"]),
         })
     )
     
-    # Service de test des mécanismes d'authentification
-    async def handle_test_auth(call: ServiceCall) -> None:
-        """Tester différentes variantes d'authentification."""
-        _LOGGER.info("🔐 Service de test d'authentification appelé")
-        
-        device_id = call.data.get("device_id")
-        auth_variant = call.data.get("auth_variant", "standard")
-        
-        # Récupérer le coordinateur pour l'appareil
-        device_registry = hass.helpers.device_registry.async_get(hass)
-        device = device_registry.async_get(device_id)
-        
-        if not device:
-            _LOGGER.error("🔐 Appareil non trouvé: %s", device_id)
-            return
-        
-        # Trouver l'entrée de configuration correspondante
-        for identifier in device.identifiers:
-            if identifier[0] == DOMAIN:
-                entry_id = identifier[1]
-                break
-        else:
-            _LOGGER.error("🔐 Impossible de trouver l'entrée de configuration pour l'appareil %s", device_id)
-            return
-        
-        coordinator = hass.data[DOMAIN].get(entry_id)
-        if not coordinator:
-            _LOGGER.error("🔐 Coordinateur non trouvé pour l'entrée %s", entry_id)
-            return
-        
-        _LOGGER.info("🔐 Test d'authentification sur l'appareil %s (variante: %s)", device_id, auth_variant)
-        
-        try:
-            # S'assurer que nous sommes connectés
-            if not coordinator.client or not coordinator.connected:
-                if not await coordinator.connect():
-                    _LOGGER.error("🔐 Impossible de se connecter pour le test d'authentification")
-                    return
-            
-            # Activer les notifications d'abord (comme dans l'app)
-            try:
-                _LOGGER.info("🔐 Activation des notifications sur 0xFFE1")
-                await coordinator.client.start_notify(
-                    "0000ffe1-0000-1000-8000-00805f9b34fb", 
-                    coordinator._notification_handler
-                )
-            except Exception as err:
-                _LOGGER.warning("🔐 Échec de l'activation des notifications: %s", err)
-            
-            # Lire la caractéristique pour obtenir la valeur d'authentification
-            auth_value = None
-            try:
-                _LOGGER.info("🔐 Lecture de la caractéristique 0xFFE1 pour obtenir le challenge")
-                value_bytes = await coordinator.client.read_gatt_char("0000ffe1-0000-1000-8000-00805f9b34fb")
-                if value_bytes:
-                    auth_value = value_bytes.hex()
-                    _LOGGER.info("🔐 Valeur d'authentification lue: %s", auth_value)
-                await asyncio.sleep(0.5)
-            except Exception as err:
-                _LOGGER.warning("🔐 Échec de la lecture: %s", err)
-            
-            # Préparer la commande selon la variante choisie
-            command = None
-            
-            if auth_variant == "standard":
-                # Format standard: d8b673097b01
-                _LOGGER.info("🔐 Utilisation du format d'authentification standard")
-                command = bytes.fromhex("d8b673097b01")
-                
-            elif auth_variant == "prefix_only":
-                # Préfixe + commande directe: d8b6737b01
-                _LOGGER.info("🔐 Utilisation du format préfixe + commande simple")
-                command = bytes.fromhex("d8b6737b01")
-                
-            elif auth_variant == "prefix_inverted":
-                # Préfixe inversé + commande: 27498c7b01
-                _LOGGER.info("🔐 Utilisation du format préfixe inversé")
-                command = bytes.fromhex("27498c7b01")
-                
-            elif auth_variant == "nrf_detected":
-                # Format complet détecté dans nRF
-                _LOGGER.info("🔐 Utilisation du format détecté dans nRF Connect")
-                # Retirons les tirets qui sont juste des séparateurs visuels
-                command = bytes.fromhex("55aa0fa10000001203031e0204000000343a".replace("-", ""))
-                
-            elif auth_variant == "challenge":
-                # Utiliser la valeur lue comme base pour la réponse d'authentification
-                if auth_value and len(auth_value) >= 12:  # au moins 6 octets
-                    _LOGGER.info("🔐 Utilisation de l'authentification par challenge-response")
-                    # Extraire les 6 premiers octets et ajouter la commande
-                    auth_prefix = auth_value[:12]  # 6 octets = 12 caractères hex
-                    command = bytes.fromhex(f"{auth_prefix}7b01")
-                else:
-                    _LOGGER.error("🔐 Impossible d'utiliser l'authentification par challenge: valeur non disponible")
-                    return
-            
-            if command:
-                _LOGGER.info("🔐 Envoi de la commande d'authentification: %s", command.hex())
-                result = await coordinator.send_raw_command(command)
-                
-                if result:
-                    _LOGGER.info("🔐 La commande d'authentification a été envoyée avec succès")
-                    hass.components.persistent_notification.create(
-                        f"La commande d'authentification a été envoyée avec succès.\n"
-                        f"Variante: {auth_variant}\n"
-                        f"Commande: {command.hex()}\n\n"
-                        f"Vérifiez si votre bidet a réagi.",
-                        "Test d'authentification",
-                        "bidet_auth_test"
-                    )
-                else:
-                    _LOGGER.error("🔐 Échec de l'envoi de la commande d'authentification")
-                    hass.components.persistent_notification.create(
-                        f"Échec de l'envoi de la commande d'authentification.\n"
-                        f"Variante: {auth_variant}\n"
-                        f"Commande: {command.hex() if command else 'N/A'}",
-                        "Test d'authentification",
-                        "bidet_auth_test"
-                    )
-            else:
-                _LOGGER.error("🔐 Aucune commande générée pour la variante %s", auth_variant)
-                
-        except Exception as err:
-            _LOGGER.error("🔐 Erreur lors du test d'authentification: %s", err)
-            hass.components.persistent_notification.create(
-                f"Erreur lors du test d'authentification: {err}",
-                "Test d'authentification",
-                "bidet_auth_test"
-            )
-    
     # Enregistrer le service de test d'authentification
     hass.services.async_register(
         DOMAIN,
         "test_auth",
-        handle_test_auth,
+        partial(_handle_test_auth, hass),
         schema=vol.Schema({
             vol.Required("device_id"): cv.string,
             vol.Required("auth_variant"): vol.In(["standard", "prefix_only", "prefix_inverted", "nrf_detected", "challenge"]),
         })
     )
     
+    hass.services.async_register(
+        DOMAIN,
+        SERVICE_FLUSH_ALL,
+        partial(_handle_flush_all, hass),
+        schema=vol.Schema({})
+    )
+    
+    # Un seul écouteur d'arrêt pour tous les bidets: déconnexions en parallèle
+    async def on_hass_stop(event):
+        """Gérer l'arrêt de Home Assistant."""
+        await asyncio.gather(
+            *(c.close() for c in hass.data[DOMAIN].values()),
+            return_exceptions=True,
+        )
+    
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, on_hass_stop)
+    
     return True
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Configurer le bidet à partir d'une entrée de configuration."""
-    # Assurez-vous que le setup général a été effectué
-    if not hass.data.get(DOMAIN):
-        hass.data[DOMAIN] = {}
-        await async_setup(hass, {})
-    
+    # async_setup est toujours appelé par Home Assistant avant les entrées et initialise hass.data[DOMAIN]
     address = entry.data[CONF_ADDRESS]
     
     coordinator = BidetCoordinator(hass, address)
-    if not await coordinator.connect():
-        raise ConfigEntryNotReady(f"Impossible de se connecter au bidet {address}")
+    
+    # Première connexion en arrière-plan pour ne pas bloquer le démarrage de Home Assistant;
+    # les commandes se reconnectent d'elles-mêmes si le bidet n'est pas encore joignable
+    entry.async_create_background_task(
+        hass, coordinator.connect(), f"{DOMAIN}_initial_connect_{address}"
+    )
     
     # Stocker le coordinateur pour être utilisé par les plateformes
-    hass.data.setdefault(DOMAIN, {})[entry.entry_id] = coordinator
+    hass.data[DOMAIN][entry.entry_id] = coordinator
     
-    # S'assurer de déconnecter proprement à l'arrêt
-    async def on_hass_stop(event):
-        """Gérer l'arrêt de Home Assistant."""
-        await coordinator.disconnect()
-        
-    # S'abonner à l'événement d'arrêt
-    entry.async_on_unload(
-        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, on_hass_stop)
+    # Garder la connexion active entre deux commandes (tâche annulée au déchargement et à l'arrêt)
+    entry.async_create_background_task(
+        hass, coordinator.keepalive(), f"{DOMAIN}_keepalive_{address}"
     )
     
     # Configurer les plateformes
@@ -938,7 +1335,11 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     # Déconnecter le bidet
     if unload_ok and entry.entry_id in hass.data[DOMAIN]:
         coordinator = hass.data[DOMAIN][entry.entry_id]
-        await coordinator.disconnect()
+        await coordinator.close()
         hass.data[DOMAIN].pop(entry.entry_id)
+
+    # Invalider le cache device_id -> entry_id pour cette entrée
+    for device_id in [d for d, e in _DEVICE_ENTRY_CACHE.items() if e == entry.entry_id]:
+        del _DEVICE_ENTRY_CACHE[device_id]
         
     return unload_ok
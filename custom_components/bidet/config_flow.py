@@ -1,5 +1,6 @@
 """Config flow for Bidet WC integration."""
 import logging
+import time
 from typing import Any
 
 import voluptuous as vol
@@ -16,6 +17,17 @@ from .const import DOMAIN, SERVICE_UUID, OLD_SERVICE_UUID
 
 _LOGGER = logging.getLogger(__name__)
 
+# UUIDs de service attendus (FFF0 nouveaux, FFE0 anciens), normalisés une seule fois
+_SERVICE_UUIDS = frozenset((SERVICE_UUID.lower(), OLD_SERVICE_UUID.lower()))
+
+# Durée pendant laquelle un scan reste valable lors des réaffichages du formulaire (secondes)
+_SCAN_CACHE_TTL = 5.0
+
+
+def _is_supported(discovery_info: BluetoothServiceInfoBleak) -> bool:
+    """Indiquer si l'appareil annonce l'un de nos services."""
+    return any(u.lower() in _SERVICE_UUIDS for u in discovery_info.service_uuids or ())
+
 
 class BidetConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for Bidet WC."""
@@ -25,6 +37,9 @@ class BidetConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     def __init__(self) -> None:
         """Initialize the config flow."""
         self._discovered_devices: dict[str, BLEDevice] = {}
+        self._last_scan_ts = 0.0
+        self._cached_schema: vol.Schema | None = None
+        self._cached_devices_key: tuple[str, ...] | None = None
 
     async def async_step_bluetooth(
         self, discovery_info: BluetoothServiceInfoBleak
@@ -34,8 +49,7 @@ class BidetConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
         self._abort_if_unique_id_configured()
 
         # Accepter uniquement les appareils exposant nos services (FFF0 nouveaux, FFE0 anciens)
-        service_uuids = {u.lower() for u in (discovery_info.service_uuids or [])}
-        if SERVICE_UUID.lower() not in service_uuids and OLD_SERVICE_UUID.lower() not in service_uuids:
+        if not _is_supported(discovery_info):
             return self.async_abort(reason="not_supported")
 
         device = discovery_info.device
@@ -63,21 +77,23 @@ class BidetConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 data=user_input,
             )
 
-        # Découvrir les appareils
-        self._discovered_devices = {}
-        current_addresses = self._async_current_ids()
-        for discovery_info in async_discovered_service_info(self.hass):
-            address = discovery_info.address
-            if address in current_addresses:
-                continue
+        # Découvrir les appareils (le scan précédent est réutilisé s'il est récent)
+        now = time.monotonic()
+        if not self._discovered_devices or now - self._last_scan_ts > _SCAN_CACHE_TTL:
+            self._discovered_devices = {}
+            current_addresses = self._async_current_ids()
+            for discovery_info in async_discovered_service_info(self.hass):
+                address = discovery_info.address
+                if address in current_addresses:
+                    continue
 
-            # Filtrer sur les UUIDs de service attendus (FFF0 nouveaux, FFE0 anciens)
-            service_uuids = {u.lower() for u in (discovery_info.service_uuids or [])}
-            if SERVICE_UUID.lower() not in service_uuids and OLD_SERVICE_UUID.lower() not in service_uuids:
-                continue
+                # Filtrer sur les UUIDs de service attendus (FFF0 nouveaux, FFE0 anciens)
+                if not _is_supported(discovery_info):
+                    continue
 
-            device = discovery_info.device
-            self._discovered_devices[address] = device
+                device = discovery_info.device
+                self._discovered_devices[address] = device
+            self._last_scan_ts = now
 
         # Si aucun appareil n'est trouvé
         if not self._discovered_devices:
@@ -90,23 +106,26 @@ class BidetConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 }
             )
 
-        # Créer un formulaire avec la liste des appareils détectés
-        data_schema = vol.Schema(
-            {
-                vol.Required(CONF_ADDRESS): vol.In(
-                    {
-                        address: f"{device.name or 'Unknown'} ({address})"
-                        for address, device in self._discovered_devices.items()
-                    }
-                ),
-                vol.Required(CONF_NAME, default="Bidet WC"): str,
-            }
-        )
-        
+        # Créer un formulaire avec la liste des appareils détectés (réutilisé si la liste n'a pas changé)
+        devices_key = tuple(sorted(self._discovered_devices))
+        if self._cached_schema is None or devices_key != self._cached_devices_key:
+            self._cached_schema = vol.Schema(
+                {
+                    vol.Required(CONF_ADDRESS): vol.In(
+                        {
+                            address: f"{device.name or 'Unknown'} ({address})"
+                            for address, device in self._discovered_devices.items()
+                        }
+                    ),
+                    vol.Required(CONF_NAME, default="Bidet WC"): str,
+                }
+            )
+            self._cached_devices_key = devices_key
+
         # Afficher le formulaire
         return self.async_show_form(
             step_id="user",
-            data_schema=data_schema,
+            data_schema=self._cached_schema,
             description_placeholders={
                 "instructions": "Pour assurer une bonne détection, redémarrez votre toilette "
                                "(coupez l'alimentation et rallumez)."
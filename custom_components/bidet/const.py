@@ -16,9 +16,24 @@ OLD_SERVICE_UUID = "0000ffe0-0000-1000-8000-00805f9b34fb"
 OLD_CHARACTERISTIC_UUID = "0000ffe1-0000-1000-8000-00805f9b34fb"
 
 # Constantes pour l'appairage
-PAIRING_TIMEOUT = 30  # Durée en secondes pour l'appairage
 SERVICE_PREPARE_PAIRING = "prepare_pairing"  # Nom du service d'appairage
 SERVICE_TEST_COMMAND = "test_command"  # Nom du service de test
+SERVICE_FLUSH_ALL = "flush_all"  # Chasse d'eau sur tous les bidets configurés
+
+# Maintien de la connexion BLE
+KEEPALIVE_INTERVAL = 15  # Intervalle en secondes entre deux lectures de maintien
+RECONNECT_BACKOFF_BASE = 0.5  # Délai de base en secondes avant une nouvelle tentative de connexion
+RECONNECT_BACKOFF_MAX = 30  # Délai maximal en secondes entre deux tentatives
+RECONNECT_MAX_EXPONENT = 6  # Plafond de l'exposant du backoff
+WRITE_ATTEMPTS = 3  # Nombre maximal de tentatives pour une écriture GATT
+CONNECT_ATTEMPTS = 3  # Tentatives de connexion confiées à bleak-retry-connector
+CONNECT_ATTEMPT_TIMEOUT = 20  # Délai d'une tentative côté bleak-retry-connector (secondes)
+# Délai global de connexion: toutes les tentatives plus une marge pour le backoff entre elles
+CONNECT_TIMEOUT = CONNECT_ATTEMPTS * CONNECT_ATTEMPT_TIMEOUT + 10
+WRITE_TIMEOUT = 5  # Délai maximal en secondes pour une écriture GATT
+READ_TIMEOUT = 5  # Délai maximal en secondes pour une lecture GATT
+RESPONSE_TIMEOUT = 0.5  # Attente maximale en secondes de la notification de retour après une commande
+READ_CACHE_TTL = 2  # Durée en secondes pendant laquelle une lecture GATT est réutilisée
 
 # Commandes
 CMD_FLUSH = "7b"  # Commande pour la chasse d'eau
@@ -28,4 +43,5 @@ VAL_FLUSH_OFF = "00"  # Valeur pour désactiver
 # Commande complète avec checksum et format
 CMD_HEADER = "55aa"  # En-tête de la commande
 CMD_PROTOCOL = "0006"  # Protocole (nouveau)
+CMD_PROTOCOL_OLD = "0001"  # Protocole (ancien)
 CMD_TRAILER = "0001"  # Fin de la commande